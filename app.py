@@ -1,12 +1,33 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from PIL import Image, ImageDraw, ImageFont
+from flask import Flask, Response, g, render_template, request, jsonify, send_file
 import yaml
 import os
-import io
 import base64
-import re
 from datetime import datetime
 import threading
+import time
+import queue
+import uuid
+import tempfile
+import copy
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+import renderer
+from renderer import (IMAGE_FORMATS, OUTPUT_DEFAULTS, PRESET_THEMES, RENDER_VERSION, YamlLoader, encode_image,
+                      file_fingerprint, generate_help_image, invalidate_font_cache, load_aliases, load_config_file,
+                      compute_layout, downscale_image, invalidate_asset_cache, layout_scale, paginate_config, resolve_alias,
+                      resolve_font_path, resolve_output_options, scale_layout, validate_config)
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # File watching is disabled without watchdog
+    FileSystemEventHandler = object
+    Observer = None
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -14,175 +35,110 @@ app.config['FONT_FOLDER'] = 'fonts'
 app.config['OUTPUT_FOLDER'] = 'output'
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 
+# The renderer resolves uploaded fonts from the same folder
+renderer.settings['FONT_FOLDER'] = app.config['FONT_FOLDER']
+
 # Ensure directories exist
 for folder in [app.config['UPLOAD_FOLDER'], app.config['FONT_FOLDER'], app.config['OUTPUT_FOLDER']]:
     os.makedirs(folder, exist_ok=True)
 
-# Global config cache
-config_cache = {}
-config_lock = threading.Lock()
-
-# Built-in color themes
-PRESET_THEMES = {
-    'default': {
-        'name': 'Sweet Cherry',
-        'background_gradient': ['#ffe5ec', '#ffd6e0'],
-        'angle': 135,
-        'card_background': '#ffffff',
-        'card_border': '#f0cfd4',
-        'title_color': '#c2185b',
-        'subtitle_color': '#d81b60',
-    },
-    'dark_mode': {
-        'name': 'Midnight Deep',
-        'background_gradient': ['#1a1a2e', '#16213e'],
-        'angle': 180,
-        'card_background': '#1e293b',
-        'card_border': '#0f172a',
-        'title_color': '#e2e8f0',
-        'subtitle_color': '#cbd5e1',
-    },
-    'purple_dream': {
-        'name': 'Purple Fantasy',
-        'background_gradient': ['#e0c3fc', '#8ec5fc'],
-        'angle': 120,
-        'card_background': '#ffffff',
-        'card_border': '#d4b5f5',
-        'title_color': '#512da8',
-        'subtitle_color': '#673ab7',
-    },
-    'green_fresh': {
-        'name': 'Forest Fresh',
-        'background_gradient': ['#c8e6c9', '#81c784'],
-        'angle': 90,
-        'card_background': '#f1f8e9',
-        'card_border': '#a5d6a7',
-        'title_color': '#1b5e20',
-        'subtitle_color': '#2e7d32',
-    },
-    'orange_vibrant': {
-        'name': 'Sunset Warmth',
-        'background_gradient': ['#ffe0b2', '#ffb74d'],
-        'angle': 45,
-        'card_background': '#ffffff',
-        'card_border': '#ffd699',
-        'title_color': '#e65100',
-        'subtitle_color': '#f57c00',
-    },
-    'sunset': {
-        'name': 'Evening Glow',
-        'background_gradient': ['#ff6b6b', '#ffa94d', '#ffd43b'],
-        'angle': 135,
-        'card_background': '#ffffff',
-        'card_border': '#ffc0d9',
-        'title_color': '#c62828',
-        'subtitle_color': '#e03131',
-    },
-    'ocean': {
-        'name': 'Ocean Azure',
-        'background_gradient': ['#0096ff', '#1fc0ff'],
-        'angle': 90,
-        'card_background': '#f0f8ff',
-        'card_border': '#81d4fa',
-        'title_color': '#00467f',
-        'subtitle_color': '#0277bd',
-    },
-    'cherry_blossom': {
-        'name': 'Cherry Bloom',
-        'background_gradient': ['#f8bbd0', '#ff80ab'],
-        'angle': 120,
-        'card_background': '#fff9e6',
-        'card_border': '#f8bbd0',
-        'title_color': '#880e4f',
-        'subtitle_color': '#ad1457',
-    },
-    'mint_fresh': {
-        'name': 'Mint Cool',
-        'background_gradient': ['#b2dfdb', '#80deea'],
-        'angle': 45,
-        'card_background': '#e0f2f1',
-        'card_border': '#80cbc4',
-        'title_color': '#00695c',
-        'subtitle_color': '#00796b',
-    },
-    'lavender_dream': {
-        'name': 'Lavender Dream',
-        'background_gradient': ['#e1bee7', '#ce93d8'],
-        'angle': 135,
-        'card_background': '#f3e5f5',
-        'card_border': '#e0bee7',
-        'title_color': '#6a1b9a',
-        'subtitle_color': '#7b1fa2',
-    },
-    'golden_hour': {
-        'name': 'Golden Hour',
-        'background_gradient': ['#fff9c4', '#ffeb3b'],
-        'angle': 90,
-        'card_background': '#fffde7',
-        'card_border': '#ffeb3b',
-        'title_color': '#b8860b',
-        'subtitle_color': '#cd853f',
-    },
-    'blush_pink': {
-        'name': 'Blush Pink',
-        'background_gradient': ['#ffccdd', '#ff99cc'],
-        'angle': 180,
-        'card_background': '#ffffff',
-        'card_border': '#ffb3d9',
-        'title_color': '#b2102f',
-        'subtitle_color': '#d32f2f',
-    },
-    'teal_elegance': {
-        'name': 'Teal Elegance',
-        'background_gradient': ['#b2dfdb', '#4db6ac'],
-        'angle': 120,
-        'card_background': '#e0f2f1',
-        'card_border': '#80cbc4',
-        'title_color': '#00251a',
-        'subtitle_color': '#004d40',
-    },
-    'coral_reef': {
-        'name': 'Coral Reef',
-        'background_gradient': ['#ffab91', '#ff7043'],
-        'angle': 45,
-        'card_background': '#ffe0d2',
-        'card_border': '#ffab91',
-        'title_color': '#5d2c0c',
-        'subtitle_color': '#8b4513',
-    },
-    'midnight_blue': {
-        'name': 'Midnight Sapphire',
-        'background_gradient': ['#1a237e', '#283593'],
-        'angle': 180,
-        'card_background': '#3f51b5',
-        'card_border': '#1a237e',
-        'title_color': '#e8eaf6',
-        'subtitle_color': '#c5cae9',
-    },
-    'spring_bud': {
-        'name': 'Spring Bud',
-        'background_gradient': ['#dcedc8', '#aed581'],
-        'angle': 90,
-        'card_background': '#f1f8e9',
-        'card_border': '#c5e1a5',
-        'title_color': '#33691e',
-        'subtitle_color': '#558b2f',
-    },
-}
+CONFIG_FILE = 'config.yaml'
+
+# Config history: the last CONFIG_HISTORY_SIZE saved versions, stored by content hash
+app.config['CONFIG_HISTORY_FOLDER'] = 'config_history'
+app.config['CONFIG_HISTORY_SIZE'] = 20
+
+# Tenants: one config (with its own history and render cache) per bot under
+# TENANT_FOLDER/<tenant>/; at most TENANT_CACHE_SIZE tenants are kept open
+app.config['TENANT_FOLDER'] = 'tenants'
+app.config['TENANT_CACHE_SIZE'] = 128
+app.config['TENANT_RENDER_CACHE_MEMORY_BYTES'] = 8 * 1024 * 1024  # 8MB per tenant
+app.config['TENANT_RENDER_CACHE_DISK_BYTES'] = 64 * 1024 * 1024  # 64MB per tenant, 0 to disable
+
+# Upload store: uploads are saved under their SHA-256, streamed in chunks
+app.config['UPLOAD_CHUNK_SIZE'] = 64 * 1024
+upload_store_lock = threading.Lock()
+
+# Output store: generated images saved once by content hash, with a latest
+# pointer per config; older ones are garbage collected in the background
+app.config['OUTPUT_MAX_FILES'] = 1000
+app.config['OUTPUT_MAX_AGE'] = 30 * 24 * 3600  # seconds since last generated, 0 to disable
+app.config['OUTPUT_MAX_BYTES'] = 1024 * 1024 * 1024  # 1GB
+app.config['OUTPUT_GC_INTERVAL'] = 3600  # seconds
+
+# Render cache: encoded images keyed by config + asset fingerprints
+app.config['RENDER_CACHE_FOLDER'] = os.path.join('cache', 'renders')
+app.config['RENDER_CACHE_MEMORY_BYTES'] = 64 * 1024 * 1024  # 64MB in memory
+app.config['RENDER_CACHE_DISK_BYTES'] = 512 * 1024 * 1024  # 512MB on disk, 0 to disable
+
+# Preview renders for the editor: downscaled, quickly encoded, never written to disk
+app.config['PREVIEW_SCALE'] = 0.5
+app.config['PREVIEW_OUTPUT'] = {'format': 'jpeg', 'quality': 80, 'compress_level': 1}
+
+# Batch rendering: number of concurrent renders per batch request (requests
+# may ask for fewer "workers", never more)
+app.config['BATCH_WORKERS'] = 4
+
+# Paginated output: default page height in pixels (overridden by layout.page_height
+# in the config or ?page_height= per request)
+app.config['PAGE_HEIGHT'] = 4000
+
+# File watching: reload config.yaml and drop stale font/asset caches when it,
+# uploads/ or fonts/ change, then pre-render in the background (needs watchdog)
+app.config['WATCH_FILES'] = True
+app.config['WATCH_DEBOUNCE'] = 0.5  # seconds of quiet before handling changes
+
+# Render job queue: background workers, queue bound, result retention and long-poll limit
+app.config['JOB_WORKERS'] = 2
+app.config['JOB_QUEUE_SIZE'] = 32
+app.config['JOB_RESULT_TTL'] = 600  # seconds
+app.config['JOB_MAX_WAIT'] = 30  # seconds
+
+# Instrumentation: stage timings, cache counters and request latency on /metrics.
+# RENDER_TIMING_HEADER adds X-Render-Timing to every /api/generate response
+# (it can also be requested per call with ?timing=1).
+app.config['METRICS_ENABLED'] = True
+app.config['RENDER_TIMING_HEADER'] = False
+metrics.settings['ENABLED'] = app.config['METRICS_ENABLED']
+
+
+def atomic_write(path, data):
+    """Write bytes to path atomically: temp file in the same folder, fsync, rename
+
+    Readers (and a crash at any point) see either the old or the new file,
+    never a partial one.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = 0o644
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        os.chmod(tmp_path, mode)  # mkstemp creates files readable by the owner only
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Persist the rename itself (not supported on Windows)
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
 
 
-def load_config():
-    """Load configuration from YAML file"""
-    with config_lock:
-        try:
-            with open('config.yaml', 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
-                config_cache.clear()
-                config_cache.update(config)
-                return config
-        except Exception as e:
-            print(f"Error loading config: {e}")
-            return None
+def config_file_key(f):
+    """Identify the on-disk state of an open config file (mtime, size, inode)"""
+    stat = os.fstat(f.fileno())
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
 
 
 class MultilineDumper(yaml.SafeDumper):
@@ -199,467 +155,1122 @@ def str_representer(dumper, data):
 MultilineDumper.add_representer(str, str_representer)
 
 
-def save_config(config):
-    """Save configuration to YAML file"""
-    with config_lock:
-        try:
-            with open('config.yaml', 'w', encoding='utf-8') as f:
-                yaml.dump(config, f, Dumper=MultilineDumper,
-                         allow_unicode=True, sort_keys=False)
-            config_cache.clear()
-            config_cache.update(config)
-            return True
-        except Exception as e:
-            print(f"Error saving config: {e}")
-            return False
+def dump_config(config):
+    """Serialize a config to the YAML bytes written to disk"""
+    return yaml.dump(config, Dumper=MultilineDumper, allow_unicode=True, sort_keys=False).encode('utf-8')
 
 
-def hex_to_rgb(hex_color):
-    """Convert hex color to RGB tuple"""
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+class ConfigHistory:
+    """Bounded ring of config.yaml versions, newest last
 
+    Each version is stored once as <folder>/<sha256>.yaml; index.json lists
+    them with their save time. Recording a version that is already present
+    moves it to the front of the ring; the oldest versions beyond size are
+    deleted.
+    """
 
-def create_gradient_background(width, height, colors, angle=135):
-    """Create a gradient background"""
-    image = Image.new('RGB', (width, height))
-    draw = ImageDraw.Draw(image)
-
-    if len(colors) < 2:
-        colors = colors + colors  # Duplicate if only one color
-
-    # Convert hex colors to RGB
-    rgb_colors = [hex_to_rgb(c) for c in colors]
+    def __init__(self, folder, size):
+        self.folder = folder
+        self.size = size
+        self.lock = threading.Lock()
+        self.index_path = os.path.join(folder, 'index.json')
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.versions = json.load(f)
+        except (OSError, ValueError):
+            self.versions = []
+
+    def _path(self, digest):
+        return os.path.join(self.folder, f'{digest}.yaml')
+
+    def record(self, data):
+        """Store a version (bytes of config.yaml) and return its sha256"""
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            if self.versions and self.versions[-1]['sha256'] == digest:
+                return digest
+            os.makedirs(self.folder, exist_ok=True)
+            if not os.path.exists(self._path(digest)):
+                atomic_write(self._path(digest), data)
+
+            self.versions = [v for v in self.versions if v['sha256'] != digest]
+            self.versions.append({'sha256': digest, 'saved': datetime.now().isoformat(timespec='seconds'),
+                                  'bytes': len(data)})
+            while len(self.versions) > self.size:
+                evicted = self.versions.pop(0)
+                try:
+                    os.remove(self._path(evicted['sha256']))
+                except OSError:
+                    pass
+            atomic_write(self.index_path, json.dumps(self.versions, indent=2).encode('utf-8'))
+        return digest
+
+    def list(self):
+        """Versions, newest first"""
+        with self.lock:
+            return list(reversed(self.versions))
+
+    def read(self, version):
+        """Return (sha256, bytes) of a version given its hash or a unique prefix of it, else (None, None)"""
+        with self.lock:
+            matches = [v['sha256'] for v in self.versions if v['sha256'].startswith(version)]
+        if len(matches) != 1 or not version:
+            return None, None
+        with open(self._path(matches[0]), 'rb') as f:
+            return matches[0], f.read()
+
+
+class ConfigStore:
+    """A YAML config file with its parsed-config cache, write lock and version history
+
+    The default store is config.yaml; every tenant has one of its own (see
+    TenantRegistry). lock only serializes writers and re-parsing; it is
+    re-entrant so update() can load and save while holding it.
+    """
+
+    def __init__(self, path, history_folder, history_size, lock=None):
+        self.path = path
+        self.history = ConfigHistory(history_folder, history_size)
+        self.lock = lock or threading.RLock()
+        # (file key, parsed config, sha256 of the file), replaced atomically
+        self.cache = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load_version(self):
+        """Load the config together with its content hash
+
+        The parsed config is cached and only re-parsed when the file changes
+        on disk. Readers never wait on the lock unless the file has to be
+        re-parsed; each caller gets its own copy of the config. A file that is
+        half-written or fails validation keeps the last valid config in use.
+        Returns (config, sha256 of the file) or (None, None).
+        """
+        try:
+            stat = os.stat(self.path)
+            file_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            cached = self.cache
+            metrics.count_cache('config', cached is not None and cached[0] == file_key)
+            if cached is None or cached[0] != file_key:
+                with self.lock:
+                    cached = self.cache
+                    if cached is None or cached[0] != file_key:
+                        with open(self.path, 'rb') as f:
+                            file_key = config_file_key(f)
+                            data = f.read()
+                        try:
+                            config = yaml.load(data, Loader=YamlLoader)
+                            validate_config(config)
+                            config_hash = hashlib.sha256(data).hexdigest()
+                        except (yaml.YAMLError, ValueError) as e:
+                            if cached is None:
+                                raise
+                            # Keep the last valid config until the file changes again
+                            print(f"Invalid config, keeping the last valid one: {e}")
+                            config, config_hash = cached[1], cached[2]
+                        cached = (file_key, config, config_hash)
+                        self.cache = cached
+            return copy.deepcopy(cached[1]), cached[2]
+        except Exception as e:
+            print(f"Error loading config: {e}")
+            return None, None
 
-    # Create gradient
-    if angle in [0, 180]:  # Horizontal
-        for x in range(width):
-            ratio = x / width
-            if angle == 180:
-                ratio = 1 - ratio
+    def save(self, config):
+        """Save a config
 
-            r = int(rgb_colors[0][0] + (rgb_colors[1][0] - rgb_colors[0][0]) * ratio)
-            g = int(rgb_colors[0][1] + (rgb_colors[1][1] - rgb_colors[0][1]) * ratio)
-            b = int(rgb_colors[0][2] + (rgb_colors[1][2] - rgb_colors[0][2]) * ratio)
+        The file is replaced atomically (see atomic_write). Saving content that
+        is already on disk is a no-op. The previous and the new version are kept
+        in the history.
+        """
+        try:
+            return self.write_data(dump_config(config), config)
+        except Exception as e:
+            print(f"Error saving config: {e}")
+            return False
 
-            draw.line([(x, 0), (x, height)], fill=(r, g, b))
-    elif angle in [90, 270]:  # Vertical
-        for y in range(height):
-            ratio = y / height
-            if angle == 270:
-                ratio = 1 - ratio
+    def write_data(self, data, config):
+        """Replace the file with data (the YAML of config) and update the cache and history"""
+        config_hash = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            cached = self.cache
+            try:
+                stat = os.stat(self.path)
+                file_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            except OSError:
+                file_key = None
+            if cached is not None and cached[0] == file_key and cached[2] == config_hash:
+                return True  # Unchanged
+
+            # Hand edits since the last save become a version of their own
+            if file_key is not None:
+                with open(self.path, 'rb') as f:
+                    self.history.record(f.read())
+            self.history.record(data)
+
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atomic_write(self.path, data)
+            with open(self.path, 'rb') as f:
+                self.cache = (config_file_key(f), copy.deepcopy(config), config_hash)
+            return True
 
-            r = int(rgb_colors[0][0] + (rgb_colors[1][0] - rgb_colors[0][0]) * ratio)
-            g = int(rgb_colors[0][1] + (rgb_colors[1][1] - rgb_colors[0][1]) * ratio)
-            b = int(rgb_colors[0][2] + (rgb_colors[1][2] - rgb_colors[0][2]) * ratio)
+    def update(self, modify):
+        """Load the config, apply modify(config) to it and save it, all under the lock
 
-            draw.line([(0, y), (width, y)], fill=(r, g, b))
-    else:  # Diagonal
-        for y in range(height):
-            for x in range(width):
-                ratio = (x + y) / (width + height)
-                if angle > 180:
-                    ratio = 1 - ratio
+        modify edits the config in place, or returns a replacement. Concurrent
+        updates of the same store are applied one after the other, so none
+        is lost; if modify raises, nothing is saved. Returns (saved config,
+        its sha256); raises ValueError if the config cannot be loaded or the
+        result is invalid.
+        """
+        with self.lock:
+            config, _ = self.load_version()
+            if not config:
+                raise ValueError('Failed to load config')
+            result = modify(config)
+            if result is not None:
+                config = result
+            validate_config(config)
+            data = dump_config(config)
+            self.write_data(data, config)
+            return config, hashlib.sha256(data).hexdigest()
 
-                r = int(rgb_colors[0][0] + (rgb_colors[1][0] - rgb_colors[0][0]) * ratio)
-                g = int(rgb_colors[0][1] + (rgb_colors[1][1] - rgb_colors[0][1]) * ratio)
-                b = int(rgb_colors[0][2] + (rgb_colors[1][2] - rgb_colors[0][2]) * ratio)
 
-                draw.point((x, y), fill=(r, g, b))
+config_store = ConfigStore(CONFIG_FILE, app.config['CONFIG_HISTORY_FOLDER'], app.config['CONFIG_HISTORY_SIZE'])
 
-    return image
 
+def load_config():
+    """Load configuration from YAML file"""
+    return load_config_version()[0]
 
-def get_font(font_name, size, emoji_support=False):
-    """Get font object, fallback to default if not found"""
-    try:
-        if font_name and font_name != 'default':
-            font_path = os.path.join(app.config['FONT_FOLDER'], font_name)
-            if os.path.exists(font_path):
-                return ImageFont.truetype(font_path, size)
-
-        # If emoji support is needed, try emoji fonts first
-        if emoji_support:
-            emoji_fonts = [
-                # Windows
-                'C:\\Windows\\Fonts\\seguiemj.ttf',  # Segoe UI Emoji
-                'C:\\Windows\\Fonts\\NotoColorEmoji.ttf',
-                # Linux
-                '/usr/share/fonts/truetype/noto/NotoColorEmoji.ttf',
-                # macOS
-                '/System/Library/Fonts/Apple Color Emoji.ttc',
-            ]
-            for font_path in emoji_fonts:
-                if os.path.exists(font_path):
-                    return ImageFont.truetype(font_path, size)
-
-        # Try common system font paths (for Chinese characters)
-        system_fonts = [
-            # Windows - Chinese fonts work better
-            'C:\\Windows\\Fonts\\msyh.ttc',  # Microsoft YaHei (supports Chinese and some emoji)
-            'C:\\Windows\\Fonts\\simhei.ttf',  # SimHei
-            'C:\\Windows\\Fonts\\simsun.ttc',  # SimSun
-            'C:\\Windows\\Fonts\\arial.ttf',
-            # Linux
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-            '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
-            # macOS
-            '/System/Library/Fonts/PingFang.ttc',
-            '/System/Library/Fonts/Helvetica.ttc',
-        ]
-
-        for font_path in system_fonts:
-            if os.path.exists(font_path):
-                return ImageFont.truetype(font_path, size)
-
-        # If all fails, use default PIL font
-        return ImageFont.load_default()
-    except Exception as e:
-        print(f"Error loading font: {e}")
-        # If all fails, use default PIL font
-        return ImageFont.load_default()
 
+def load_config_version():
+    """Load config.yaml together with its content hash (see ConfigStore.load_version)"""
+    return config_store.load_version()
 
-def clean_markdown(text):
-    """Simple markdown cleanup for image rendering - now preserves formatting markers"""
-    if not text:
-        return ''
-    # Remove only link markdown, keep bold/italic markers for rendering
-    text = re.sub(r'\[(.+?)\]\(.+?\)', r'\1', text)  # [link](url) -> text
-    return text
 
+def save_config(config):
+    """Save configuration to config.yaml (see ConfigStore.save)"""
+    return config_store.save(config)
 
-def draw_text_with_style(draw, position, text, font, color, bold=False, italic=False):
-    """Draw text with bold/italic style support and multi-line support"""
-    if not text:
-        return
 
-    x, y = position
+def store_upload(stream, folder, filename):
+    """Stream an upload into the content-addressed store of folder
 
-    # Support multi-line text by splitting on newlines
-    lines = text.split('\n')
+    The upload is hashed while it is copied to disk in chunks, then moved
+    to <folder>/objects/<sha256><ext>; identical content is stored once.
+    filename becomes an alias for the object in <folder>/aliases.json.
+    Returns (object path, sha256 hex digest).
+    """
+    objects_folder = os.path.join(folder, 'objects')
+    os.makedirs(objects_folder, exist_ok=True)
 
-    # Calculate line height (font size + spacing)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=objects_folder, suffix='.part')
     try:
-        # Try to get font size from bbox
-        bbox = font.getbbox('Ay')
-        line_height = bbox[3] - bbox[1] + 5  # Add 5px spacing
-    except:
-        # Fallback to estimated height
-        line_height = 20
-
-    # Draw each line
-    for i, line in enumerate(lines):
-        line_y = y + (i * line_height)
-
-        if bold:
-            # Simulate bold by drawing text multiple times with slight offsets
-            for offset in [(0, 0), (1, 0), (0, 1), (1, 1)]:
-                draw.text((x + offset[0], line_y + offset[1]), line, fill=color, font=font)
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(app.config['UPLOAD_CHUNK_SIZE'])
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+
+        extension = os.path.splitext(filename)[1].lower()
+        object_path = os.path.join(objects_folder, digest.hexdigest() + extension)
+        if os.path.exists(object_path):
+            os.remove(tmp_path)  # Same content already stored
         else:
-            # Normal text
-            draw.text((x, line_y), line, fill=color, font=font)
-
-    # Note: Italic is not supported in PIL/Pillow without complex transformations
-    # Users should use italic font files if needed
-
-
-def draw_text_with_markdown(draw, position, text, font, color, bold=False, italic=False):
-    """Draw text with basic markdown support (bold) and optional style"""
-    if not text:
-        return
-
-    x, y = position
-    current_x = x
-
-    # Split text by bold markers
-    parts = re.split(r'(\*\*.*?\*\*|__.*?__)', text)
-
-    for part in parts:
-        if not part:
-            continue
-
-        # Check if this part is bold
-        is_bold = part.startswith('**') and part.endswith('**') or part.startswith('__') and part.endswith('__')
-
-        if is_bold:
-            # Remove markers
-            clean_part = part[2:-2]
-            # Draw bold by drawing the text multiple times with slight offsets
-            for offset in [(0, 0), (1, 0), (0, 1), (1, 1)]:
-                draw.text((current_x + offset[0], y + offset[1]), clean_part, fill=color, font=font)
-        else:
-            # Normal text - apply base style if specified
-            if bold:
-                for offset in [(0, 0), (1, 0), (0, 1), (1, 1)]:
-                    draw.text((current_x + offset[0], y + offset[1]), part, fill=color, font=font)
+            os.replace(tmp_path, object_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    with upload_store_lock:
+        aliases = load_aliases(folder)
+        aliases[filename] = {
+            'path': object_path,
+            'sha256': digest.hexdigest(),
+            'uploaded': datetime.now().isoformat(timespec='seconds'),
+        }
+        atomic_write(os.path.join(folder, 'aliases.json'),
+                     json.dumps(aliases, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    return object_path, digest.hexdigest()
+
+
+class OutputStore:
+    """Content-addressed store of generated images with a latest pointer per config
+
+    Images are saved once as <folder>/objects/<sha256>.<ext>: identical
+    renders share a file and concurrent saves cannot overwrite each other.
+    latest.json maps each config name to its newest image, which is also
+    linked as <folder>/<name>_latest.<ext>. A background thread applies the
+    retention policy every gc_interval seconds, or as soon as a save goes
+    over a limit: images not generated for max_age seconds are removed,
+    then the least recently generated ones beyond max_files or max_bytes.
+    Latest images are never removed. Legacy help_menu_<timestamp> files in
+    the folder are removed by age only.
+    """
+
+    def __init__(self, folder, max_files, max_age, max_bytes, gc_interval):
+        self.folder = folder
+        self.objects_folder = os.path.join(folder, 'objects')
+        self.max_files = max_files
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.gc_interval = gc_interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.files = 0  # objects and their total size as of the last collection, plus saves since
+        self.total_bytes = 0
+        self.latest_path = os.path.join(folder, 'latest.json')
+        try:
+            with open(self.latest_path, 'r', encoding='utf-8') as f:
+                self.latest = json.load(f)
+        except (OSError, ValueError):
+            self.latest = {}
+
+    def start(self):
+        """Start the garbage collection thread (idempotent)"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name='output-gc', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                removed, freed = self.collect()
+                if removed:
+                    print(f"Output store: removed {removed} files ({freed} bytes)")
+            except Exception as e:
+                print(f"Error collecting output files: {e}")
+            self.wakeup.wait(self.gc_interval)
+            self.wakeup.clear()
+
+    def save(self, data, extension, name=None):
+        """Store encoded image bytes, point name's latest at them and return the object path"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.objects_folder, f'{digest}.{extension}')
+        with self.lock:
+            os.makedirs(self.objects_folder, exist_ok=True)
+            if os.path.exists(path):
+                os.utime(path)  # Generated again: keep it for another max_age
             else:
-                draw.text((current_x, y), part, fill=color, font=font)
+                atomic_write(path, data)
+                self.files += 1
+                self.total_bytes += len(data)
+
+            if name and self.latest.get(name, {}).get('path') != path:
+                self._link_latest(name, path, extension)
+                self.latest[name] = {'path': path, 'sha256': digest,
+                                     'updated': datetime.now().isoformat(timespec='seconds')}
+                atomic_write(self.latest_path, json.dumps(self.latest, ensure_ascii=False, indent=2).encode('utf-8'))
+            over_limit = self.files > self.max_files or self.total_bytes > self.max_bytes
+
+        self.start()
+        if over_limit:
+            self.wakeup.set()
+        return path
+
+    def _link_latest(self, name, path, extension):
+        """Point <folder>/<name>_latest.<ext> at an object (a hard link, or a copy where unsupported)"""
+        previous = self.latest.get(name)
+        if previous and os.path.splitext(previous['path'])[1] != f'.{extension}':
+            try:
+                os.remove(os.path.join(self.folder, f'{name}_latest{os.path.splitext(previous["path"])[1]}'))
+            except OSError:
+                pass
+
+        link_path = os.path.join(self.folder, f'{name}_latest.{extension}')
+        tmp_path = os.path.join(self.folder, f'.{name}_latest.{uuid.uuid4().hex}.tmp')
+        try:
+            os.link(path, tmp_path)
+            os.replace(tmp_path, link_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with open(path, 'rb') as f:
+                atomic_write(link_path, f.read())
+
+    def collect(self):
+        """Apply the retention policy now; returns (files removed, bytes freed)"""
+        now = time.time()
+        removed = freed = 0
+        with self.lock:
+            latest = {entry['path'] for entry in self.latest.values()}
+            objects = []
+            if os.path.isdir(self.objects_folder):
+                with os.scandir(self.objects_folder) as entries:
+                    for entry in entries:
+                        if entry.is_file() and not entry.name.startswith('.'):
+                            stat = entry.stat()
+                            objects.append((stat.st_mtime, entry.path, stat.st_size))
+            objects.sort()  # Least recently generated first
+
+            files, total_bytes = len(objects), sum(size for _, _, size in objects)
+            for mtime, path, size in objects:
+                if path in latest:
+                    continue
+                expired = self.max_age and now - mtime > self.max_age
+                if not (expired or files > self.max_files or total_bytes > self.max_bytes):
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                files -= 1
+                total_bytes -= size
+                removed += 1
+                freed += size
+            self.files, self.total_bytes = files, total_bytes
+
+        # Files written before the store existed
+        if self.max_age and os.path.isdir(self.folder):
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.startswith('help_menu_'):
+                        stat = entry.stat()
+                        if now - stat.st_mtime > self.max_age:
+                            try:
+                                os.remove(entry.path)
+                            except OSError:
+                                continue
+                            removed += 1
+                            freed += stat.st_size
+        return removed, freed
+
+
+output_store = OutputStore(app.config['OUTPUT_FOLDER'], app.config['OUTPUT_MAX_FILES'], app.config['OUTPUT_MAX_AGE'],
+                           app.config['OUTPUT_MAX_BYTES'], app.config['OUTPUT_GC_INTERVAL'])
+
+
+class RenderCache:
+    """Content-addressed LRU cache of encoded renders (memory + disk)
+
+    Entries are keyed by render_cache_key(); the memory tier holds the
+    encoded bytes, the disk tier keeps them across restarts. Each tier is
+    bounded by a byte budget and evicts least recently used entries first.
+    """
+
+    def __init__(self, max_memory_bytes, max_disk_bytes, folder):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # key -> {'data': bytes, 'path': output path}
+        self.memory_bytes = 0
+        self.disk = OrderedDict()  # key -> file size
+        self.disk_bytes = 0
+
+        if self.max_disk_bytes > 0:
+            os.makedirs(self.folder, exist_ok=True)
+            entries = []
+            for filename in os.listdir(self.folder):
+                if filename.endswith('.bin'):
+                    stat = os.stat(os.path.join(self.folder, filename))
+                    entries.append((stat.st_mtime, filename[:-4], stat.st_size))
+            for _, key, size in sorted(entries):
+                self.disk[key] = size
+                self.disk_bytes += size
+            self._evict_disk()
+
+    def _disk_path(self, key):
+        return os.path.join(self.folder, f'{key}.bin')
+
+    def _evict_memory(self):
+        while self.memory and self.memory_bytes > self.max_memory_bytes:
+            _, entry = self.memory.popitem(last=False)
+            self.memory_bytes -= len(entry['data'])
+
+    def _evict_disk(self):
+        while self.disk and self.disk_bytes > self.max_disk_bytes:
+            key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def get(self, key):
+        """Return the cached entry ({'data', 'path'}) or None"""
+        entry = self._lookup(key)
+        metrics.count_cache('render', entry is not None)
+        return entry
+
+    def _lookup(self, key):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                return entry
+            if key not in self.disk:
+                return None
+            self.disk.move_to_end(key)
 
-        # Calculate width to advance x position
         try:
-            bbox = font.getbbox(part[2:-2] if is_bold else part)
-            part_width = bbox[2] - bbox[0]
-            current_x += part_width
-        except:
-            # Fallback if getbbox fails
-            current_x += len(part) * 10
-
-
-def draw_rounded_rectangle(draw, xy, radius, fill, outline=None, width=1):
-    """Draw a rounded rectangle"""
-    x1, y1, x2, y2 = xy
-
-    # Draw rounded corners
-    draw.ellipse([x1, y1, x1 + radius * 2, y1 + radius * 2], fill=fill, outline=outline, width=width)
-    draw.ellipse([x2 - radius * 2, y1, x2, y1 + radius * 2], fill=fill, outline=outline, width=width)
-    draw.ellipse([x1, y2 - radius * 2, x1 + radius * 2, y2], fill=fill, outline=outline, width=width)
-    draw.ellipse([x2 - radius * 2, y2 - radius * 2, x2, y2], fill=fill, outline=outline, width=width)
-
-    # Draw rectangles to fill the gaps
-    draw.rectangle([x1 + radius, y1, x2 - radius, y2], fill=fill, outline=outline, width=width)
-    draw.rectangle([x1, y1 + radius, x2, y2 - radius], fill=fill, outline=outline, width=width)
-
-
-def generate_help_image(config):
-    """Generate help menu image based on configuration"""
-
-    # Get configuration values
-    layout = config.get('layout', {})
-    theme = config.get('theme', {})
-    bot_info = config.get('bot_info', {})
-    sections = config.get('sections', [])
-    fonts_config = config.get('fonts', {})
-
-    # Image dimensions
-    items_per_row = layout.get('items_per_row', 3)
-    card_width = layout.get('card_width', 200)
-    card_height = layout.get('card_height', 80)
-    padding = layout.get('padding', 20)
-    spacing = layout.get('spacing', 15)
-
-    # Calculate image size
-    max_items = max([len(section.get('items', [])) for section in sections] + [0])
-    rows_per_section = (max_items + items_per_row - 1) // items_per_row
-
-    header_height = 200
-    section_title_height = 60
-
-    total_width = padding * 2 + (card_width + spacing) * items_per_row - spacing
-    section_height = section_title_height + (card_height + spacing) * rows_per_section + spacing
-    total_height = header_height + len(sections) * section_height + padding * 2
-
-    # Create base image
-    if theme.get('background_type') == 'gradient':
-        gradient_colors = theme.get('background_gradient', ['#ffeef8', '#e6f3ff'])
-        angle = theme.get('angle', 135)
-        image = create_gradient_background(total_width, total_height, gradient_colors, angle)
-    elif theme.get('background_type') == 'image' and theme.get('background_image'):
+            disk_path = self._disk_path(key)
+            with open(disk_path, 'rb') as f:
+                data = f.read()
+            os.utime(disk_path)
+        except OSError:
+            with self.lock:
+                self.disk_bytes -= self.disk.pop(key, 0)
+            return None
+
+        entry = {'data': data, 'path': None}
+        self._store_memory(key, entry)
+        return entry
+
+    def _store_memory(self, key, entry):
+        if len(entry['data']) > self.max_memory_bytes:
+            return
+        with self.lock:
+            old = self.memory.pop(key, None)
+            if old is not None:
+                self.memory_bytes -= len(old['data'])
+            self.memory[key] = entry
+            self.memory_bytes += len(entry['data'])
+            self._evict_memory()
+
+    def put(self, key, data, path=None, persist=True):
+        """Store encoded render bytes (and the output file they were saved to)
+
+        With persist=False the entry is only kept in memory.
+        """
+        self._store_memory(key, {'data': data, 'path': path})
+
+        if not persist or self.max_disk_bytes <= 0 or len(data) > self.max_disk_bytes:
+            return
+        with self.lock:
+            if key in self.disk:
+                self.disk.move_to_end(key)
+                return
+        # Every writer gets its own temp file: concurrent puts of the same key
+        # both write complete files and the last rename wins
+        tmp_path = None
         try:
-            bg_path = theme.get('background_image')
-            image = Image.open(bg_path).resize((total_width, total_height))
-        except:
-            image = Image.new('RGB', (total_width, total_height), hex_to_rgb(theme.get('background_color', '#f5f5f5')))
+            fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix=f'.{key}.', suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"Error writing render cache: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self.lock:
+            if key in self.disk:  # Another writer stored it meanwhile; count it once
+                self.disk.move_to_end(key)
+                return
+            self.disk[key] = len(data)
+            self.disk_bytes += len(data)
+            self._evict_disk()
+
+    def clear(self):
+        """Drop every cached render"""
+        with self.lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+            for key in self.disk:
+                try:
+                    os.remove(self._disk_path(key))
+                except OSError:
+                    pass
+            self.disk.clear()
+            self.disk_bytes = 0
+
+
+render_cache = None
+render_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """Get the process-wide render cache, creating it from app.config on first use"""
+    global render_cache
+    with render_cache_lock:
+        if render_cache is None:
+            render_cache = RenderCache(app.config['RENDER_CACHE_MEMORY_BYTES'],
+                                       app.config['RENDER_CACHE_DISK_BYTES'],
+                                       app.config['RENDER_CACHE_FOLDER'])
+        return render_cache
+
+
+# Tenant ids double as folder names
+TENANT_ID_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+
+class TenantRegistry:
+    """Config stores and render caches of the tenants, opened on demand
+
+    Tenant t keeps its config in <folder>/<t>/config.yaml, its history in
+    <folder>/<t>/history and its render cache in <cache folder>/<t>, so
+    tenants never share a lock, a config cache or a render cache budget.
+    At most size tenants stay open; closing the least recently used one
+    only drops its parsed config and in-memory renders. Locks outlive the
+    open stores, so a tenant reopened while a request still holds the old
+    store keeps serializing its writes.
+    """
+
+    def __init__(self, folder, cache_folder, size):
+        self.folder = folder
+        self.cache_folder = cache_folder
+        self.size = size
+        self.lock = threading.Lock()
+        self.tenants = OrderedDict()  # tenant -> (ConfigStore, RenderCache)
+        self.locks = {}  # tenant -> RLock
+
+    def _config_path(self, tenant):
+        return os.path.join(self.folder, tenant, 'config.yaml')
+
+    def get(self, tenant, create=False):
+        """Return (config store, render cache) of a tenant
+
+        Returns None for an invalid id, or for a tenant without a config
+        unless create is set (the config is written by the first save).
+        """
+        if not TENANT_ID_RE.match(tenant):
+            return None
+        if not create and not os.path.exists(self._config_path(tenant)):
+            return None
+        with self.lock:
+            entry = self.tenants.get(tenant)
+            if entry is not None:
+                self.tenants.move_to_end(tenant)
+                return entry
+
+            lock = self.locks.setdefault(tenant, threading.RLock())
+            store = ConfigStore(self._config_path(tenant), os.path.join(self.folder, tenant, 'history'),
+                                app.config['CONFIG_HISTORY_SIZE'], lock)
+            cache = RenderCache(app.config['TENANT_RENDER_CACHE_MEMORY_BYTES'],
+                                app.config['TENANT_RENDER_CACHE_DISK_BYTES'], os.path.join(self.cache_folder, tenant))
+            entry = self.tenants[tenant] = (store, cache)
+            while len(self.tenants) > self.size:
+                self.tenants.popitem(last=False)
+            return entry
+
+    def list(self):
+        """Every tenant with its newest saved version, sorted by id"""
+        tenants = []
+        if not os.path.isdir(self.folder):
+            return tenants
+        for tenant in sorted(os.listdir(self.folder)):
+            if not TENANT_ID_RE.match(tenant) or not os.path.exists(self._config_path(tenant)):
+                continue
+            versions = ConfigHistory(os.path.join(self.folder, tenant, 'history'), 0).list()
+            tenants.append({
+                'tenant': tenant,
+                'version': versions[0]['sha256'] if versions else None,
+                'saved': versions[0]['saved'] if versions else None,
+                'versions': len(versions),
+            })
+        return tenants
+
+
+tenants = TenantRegistry(app.config['TENANT_FOLDER'], os.path.join('cache', 'tenants'), app.config['TENANT_CACHE_SIZE'])
+
+
+def tenant_store(tenant, create=False):
+    """Config store and render cache of a tenant, or of config.yaml for tenant None
+
+    Returns (None, None) if the tenant does not exist.
+    """
+    if tenant is None:
+        return config_store, get_render_cache()
+    return tenants.get(tenant, create) or (None, None)
+
+
+def tenant_not_found():
+    return jsonify({'success': False, 'error': 'Tenant not found'}), 404
+
+
+class PatchTestFailed(ValueError):
+    """A JSON Patch 'test' operation did not match the config"""
+
+
+def json_pointer(pointer):
+    """Split a JSON Pointer (RFC 6901) into its unescaped reference tokens"""
+    if pointer == '':
+        return []
+    if not isinstance(pointer, str) or not pointer.startswith('/'):
+        raise ValueError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def array_index(array, token, pointer, insert=False):
+    """Index of an array token; with insert, '-' and len(array) (append) are allowed too"""
+    if insert and token == '-':
+        return len(array)
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise ValueError(f"Invalid array index in {pointer}")
+    index = int(token)
+    if index > len(array) or (index == len(array) and not insert):
+        raise ValueError(f"Array index out of range: {pointer}")
+    return index
+
+
+def pointer_child(target, token, pointer):
+    if isinstance(target, dict) and token in target:
+        return target[token]
+    if isinstance(target, list):
+        return target[array_index(target, token, pointer)]
+    raise ValueError(f"Path not found: {pointer}")
+
+
+def pointer_get(document, pointer):
+    """Value at a JSON Pointer"""
+    target = document
+    for token in json_pointer(pointer):
+        target = pointer_child(target, token, pointer)
+    return target
+
+
+def pointer_parent(document, pointer):
+    """Resolve a non-empty pointer to (parent container, last token)"""
+    tokens = json_pointer(pointer)
+    target = document
+    for token in tokens[:-1]:
+        target = pointer_child(target, token, pointer)
+    if not isinstance(target, (dict, list)):
+        raise ValueError(f"Path not found: {pointer}")
+    return target, tokens[-1]
+
+
+def pointer_add(document, pointer, value):
+    """Add (or for object members, set) value at a pointer; returns the document"""
+    if pointer == '':
+        return value
+    parent, token = pointer_parent(document, pointer)
+    if isinstance(parent, dict):
+        parent[token] = value
     else:
-        image = Image.new('RGB', (total_width, total_height), hex_to_rgb(theme.get('background_color', '#f5f5f5')))
-
-    draw = ImageDraw.Draw(image)
-
-    # Load fonts
-    title_font = get_font(fonts_config.get('title_font'), fonts_config.get('title_size', 32))
-    subtitle_font = get_font(fonts_config.get('content_font'), fonts_config.get('subtitle_size', 18))
-    card_title_font = get_font(fonts_config.get('content_font'), fonts_config.get('card_title_size', 16))
-    card_desc_font = get_font(fonts_config.get('content_font'), fonts_config.get('card_desc_size', 12))
-    # Load emoji font for icons
-    emoji_font = get_font(None, fonts_config.get('card_title_size', 16), emoji_support=True)
-
-    # Draw header
-    y_offset = padding
+        parent.insert(array_index(parent, token, pointer, insert=True), value)
+    return document
+
+
+def pointer_remove(document, pointer):
+    """Remove the value at a pointer and return it"""
+    if pointer == '':
+        raise ValueError('Cannot remove the whole config')
+    parent, token = pointer_parent(document, pointer)
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise ValueError(f"Path not found: {pointer}")
+        return parent.pop(token)
+    return parent.pop(array_index(parent, token, pointer))
+
+
+def apply_json_patch(document, operations):
+    """Apply a JSON Patch (RFC 6902) list of operations; returns the patched document
+
+    The document is modified in place (the root can be replaced). Raises
+    ValueError for an invalid operation and PatchTestFailed when a 'test'
+    does not match; callers apply patches to a copy so a failed patch
+    leaves nothing half-applied.
+    """
+    if not isinstance(operations, list):
+        raise ValueError('A JSON Patch must be a list of operations')
+    for operation in operations:
+        if not isinstance(operation, dict) or not isinstance(operation.get('path'), str):
+            raise ValueError(f"Invalid patch operation: {operation!r}")
+        op, path = operation.get('op'), operation['path']
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise ValueError(f"Patch operation '{op}' needs a value")
+        if op in ('move', 'copy') and not isinstance(operation.get('from'), str):
+            raise ValueError(f"Patch operation '{op}' needs a 'from' pointer")
+
+        if op == 'add':
+            document = pointer_add(document, path, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            pointer_remove(document, path)
+        elif op == 'replace':
+            if path:
+                pointer_remove(document, path)  # The target must exist
+            document = pointer_add(document, path, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            source = operation['from']
+            if path == source:
+                continue
+            if path.startswith(source + '/'):
+                raise ValueError(f"Cannot move {source} into itself")
+            document = pointer_add(document, path, pointer_remove(document, source))
+        elif op == 'copy':
+            document = pointer_add(document, path, copy.deepcopy(pointer_get(document, operation['from'])))
+        elif op == 'test':
+            if pointer_get(document, path) != operation['value']:
+                raise PatchTestFailed(f"Test failed at {path or '/'}")
+        else:
+            raise ValueError(f"Unknown patch operation: {op!r}")
+    return document
+
+
+def apply_merge_patch(target, patch):
+    """Apply a JSON Merge Patch (RFC 7386): objects merge recursively, null deletes, anything else replaces"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    if not isinstance(target, dict):
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = apply_merge_patch(target.get(key), value)
+    return target
+
+
+def config_changes(before, after):
+    """Describe the difference between two configs
+
+    keys lists the top-level keys that differ. sections lists the indices
+    (in after) of sections that have no identical section in before, i.e.
+    the only sections whose layers have to be drawn again: layers are keyed
+    by content, so reordered or untouched sections stay cached.
+    dropped_sections counts the sections of before that are no longer used.
+    """
+    keys = sorted(key for key in set(before) | set(after) if before.get(key) != after.get(key))
+    unmatched = [json.dumps(section, sort_keys=True, default=str) for section in before.get('sections') or []]
+    sections = []
+    for index, section in enumerate(after.get('sections') or []):
+        key = json.dumps(section, sort_keys=True, default=str)
+        if key in unmatched:
+            unmatched.remove(key)
+        else:
+            sections.append(index)
+    return {'keys': keys, 'sections': sections, 'dropped_sections': len(unmatched)}
+
+
+def render_cache_key(config, variant='png', config_hash=None):
+    """Hash the canonical config plus fingerprints of every referenced asset
+
+    RENDER_VERSION is part of the key, so bumping it expires the disk cache
+    and every ETag handed out for older renders.
+    variant distinguishes encodings of the same render (e.g. resolved output options).
+    config_hash, the content hash of config.yaml from load_config_version,
+    stands in for the config so it does not have to be serialized again.
+    """
+    theme = config.get('theme', {}) or {}
+    bot_info = config.get('bot_info', {}) or {}
+    fonts_config = config.get('fonts', {}) or {}
+
+    assets = {
+        'avatar': file_fingerprint(bot_info.get('avatar')),
+        'logo': file_fingerprint(bot_info.get('logo')),
+        'background_image': file_fingerprint(theme.get('background_image')),
+        'title_font': file_fingerprint(resolve_font_path(fonts_config.get('title_font'))),
+        'content_font': file_fingerprint(resolve_font_path(fonts_config.get('content_font'))),
+        'emoji_font': file_fingerprint(resolve_font_path(None, emoji_support=True)),
+    }
+
+    payload = json.dumps({'config': {'sha256': config_hash} if config_hash else config,
+                          'assets': assets, 'variant': variant, 'render_version': RENDER_VERSION},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_encoded(config, options, config_hash=None):
+    """Render and encode a config, serving repeated requests from the render cache
+
+    Returns (encoded bytes, encode stats or None on a cache hit, whether it was a cache hit).
+    """
+    cache_key = render_cache_key(config, options, config_hash)
+    cached = get_render_cache().get(cache_key)
+    if cached is not None:
+        return cached['data'], None, True
+
+    data, stats = encode_image(generate_help_image(config), options)
+    get_render_cache().put(cache_key, data)
+    return data, stats, False
+
+
+def render_batch_item(index, source):
+    """Render one batch entry (a config dict or a path to a YAML file)"""
+    name = f'config_{index}'
+    try:
+        if isinstance(source, str):
+            name = os.path.splitext(os.path.basename(source))[0]
+            config = load_config_file(source)
+        else:
+            config = source
+        validate_config(config)
 
-    # Draw avatar if exists
-    avatar_path = bot_info.get('avatar', '')
-    if avatar_path and os.path.exists(avatar_path):
+        options = resolve_output_options(config)
+        data, stats, cached = render_encoded(config, options)
+        return {'index': index, 'name': name, 'success': True, 'data': data, 'cached': cached,
+                'format': options['format'], 'encode': stats}
+    except Exception as e:
+        print(f"Error rendering batch entry {index}: {e}")
+        return {'index': index, 'name': name, 'success': False, 'error': str(e)}
+
+
+def render_batch(sources, workers=None):
+    """Render many configs concurrently, yielding results as they complete
+
+    sources is a list of config dicts and/or YAML file paths. Renders run
+    on a thread pool inside this process, so fonts, background/layer
+    caches and the render cache are shared across the whole batch. Each
+    result has index, name, success and either data (encoded with the
+    config's output options), format, encode stats and cached, or error.
+    """
+    workers = workers or app.config['BATCH_WORKERS']
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_batch_item, index, source) for index, source in enumerate(sources)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+class RenderJobQueue:
+    """Bounded pool of background render workers with in-flight deduplication
+
+    Jobs are keyed by their render cache key: submitting a config that is
+    already queued or rendering returns the existing job. When the queue
+    is full, submit() raises queue.Full so callers can apply backpressure.
+    Finished jobs are kept for result_ttl seconds.
+    """
+
+    def __init__(self, workers, max_queued, result_ttl):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.lock = threading.Lock()
+        self.jobs = {}  # job id -> job
+        self.in_flight = {}  # render cache key -> job id
+        self.threads = []
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self.lock:
+            if self.threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'render-worker-{index}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job['finished'] and now - job['finished'] > self.result_ttl]:
+            del self.jobs[job_id]
+
+    def submit(self, config, options, config_hash=None):
+        """Queue a render, returning (job, whether an in-flight job was reused)"""
+        self.start()
+        cache_key = render_cache_key(config, options, config_hash)
+        with self.lock:
+            self._expire()
+            job_id = self.in_flight.get(cache_key)
+            if job_id is not None:
+                return self.jobs[job_id], True
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'key': cache_key,
+                'status': 'queued',
+                'format': options['format'],
+                'created': time.time(),
+                'started': None,
+                'finished': None,
+                'error': None,
+                'data': None,
+                'encode': None,
+                'cached': False,
+                'done': threading.Event(),
+            }
+            self.queue.put_nowait((job, config, options, config_hash))  # raises queue.Full
+            self.jobs[job['id']] = job
+            self.in_flight[cache_key] = job['id']
+            return job, False
+
+    def get(self, job_id):
+        """Return a job by id, or None if unknown or expired"""
+        with self.lock:
+            self._expire()
+            return self.jobs.get(job_id)
+
+    def _worker(self):
+        while True:
+            job, config, options, config_hash = self.queue.get()
+            job['status'] = 'running'
+            job['started'] = time.time()
+            try:
+                job['data'], job['encode'], job['cached'] = render_encoded(config, options, config_hash)
+                job['status'] = 'done'
+            except Exception as e:
+                print(f"Error rendering job {job['id']}: {e}")
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            finally:
+                with self.lock:
+                    job['finished'] = time.time()
+                    self.in_flight.pop(job['key'], None)
+                job['done'].set()
+                self.queue.task_done()
+
+
+render_jobs = RenderJobQueue(app.config['JOB_WORKERS'], app.config['JOB_QUEUE_SIZE'], app.config['JOB_RESULT_TTL'])
+
+
+class FileWatcher(FileSystemEventHandler):
+    """Debounced watcher for config.yaml, the upload folder and the font folder
+
+    Events are collected until the files have been quiet for `debounce`
+    seconds and then handled once: changed fonts drop the font caches,
+    changed uploads drop their decoded assets, and the config is re-read
+    through load_config (parsed and validated once, swapped atomically,
+    invalid files are ignored). Finally the current config is queued for a
+    background render so the next /api/generate is a render cache hit.
+    """
+
+    def __init__(self, debounce):
+        self.debounce = debounce
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.timer = None
+        self.observer = None
+        self.config_path = os.path.abspath(CONFIG_FILE)
+        self.folders = {'upload': os.path.abspath(app.config['UPLOAD_FOLDER']),
+                        'font': os.path.abspath(app.config['FONT_FOLDER'])}
+
+    def start(self):
+        """Start watching (idempotent); returns False when watchdog is not installed"""
+        if Observer is None:
+            print("watchdog is not installed, file watching is disabled")
+            return False
+        with self.lock:
+            if self.observer is not None:
+                return True
+            self.observer = Observer()
+            self.observer.daemon = True
+            self.observer.schedule(self, os.path.dirname(self.config_path), recursive=False)
+            for folder in self.folders.values():
+                self.observer.schedule(self, folder, recursive=True)
+            self.observer.start()
+        self.prerender()
+        return True
+
+    def stop(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            if self.observer is not None:
+                self.observer.stop()
+                self.observer = None
+
+    def classify(self, path):
+        """Return (kind, path) for a watched file, or None to ignore it"""
+        path = os.path.abspath(path)
+        if path == self.config_path:
+            return ('config', path)
+        if path.endswith(('.part', '.tmp')) or os.path.basename(path).startswith('.'):
+            return None  # Upload or config being written
+        for kind, folder in self.folders.items():
+            if path.startswith(folder + os.sep):
+                return (kind, path)
+        return None
+
+    def on_any_event(self, event):
+        # Reads (including our own re-parse and pre-render) raise 'opened' events
+        if event.is_directory or event.event_type == 'opened':
+            return
+        changes = [self.classify(path) for path in (event.src_path, getattr(event, 'dest_path', None)) if path]
+        changes = [change for change in changes if change]
+        if not changes:
+            return
+        with self.lock:
+            self.pending.update(changes)
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Handle the changes collected since the last flush"""
+        with self.lock:
+            changes, self.pending = self.pending, set()
+            self.timer = None
+
+        kinds = {kind for kind, _ in changes}
+        if 'font' in kinds:
+            invalidate_font_cache()
+        for kind, path in changes:
+            if kind == 'upload':
+                invalidate_asset_cache(os.path.relpath(path))
+        print(f"Files changed: {', '.join(sorted(os.path.relpath(path) for _, path in changes))}")
+        self.prerender()
+
+    def prerender(self):
+        """Queue the current config for rendering with its default output options"""
+        config, config_hash = load_config_version()
+        if not config:
+            return
         try:
-            avatar = Image.open(avatar_path).resize((80, 80))
-            # Create circular mask
-            mask = Image.new('L', (80, 80), 0)
-            mask_draw = ImageDraw.Draw(mask)
-            mask_draw.ellipse([0, 0, 80, 80], fill=255)
-            image.paste(avatar, (padding, y_offset), mask)
+            render_jobs.submit(config, resolve_output_options(config), config_hash)
+        except queue.Full:
+            pass  # Busy; the next request renders it
         except Exception as e:
-            print(f"Error loading avatar: {e}")
+            print(f"Error pre-rendering config: {e}")
 
-    # Draw logo if exists (in top-right corner)
-    logo_path = bot_info.get('logo', '')
-    if logo_path and os.path.exists(logo_path):
-        try:
-            logo_img = Image.open(logo_path).convert('RGBA')
-            # Calculate size maintaining aspect ratio (max 80x80)
-            max_size = 80
-            logo_img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            logo_width, logo_height = logo_img.size
-            # Position in top-right corner
-            logo_x = total_width - padding - logo_width
-            logo_y = padding
-            image.paste(logo_img, (logo_x, logo_y), logo_img)
-        except Exception as e:
-            print(f"Error loading logo: {e}")
-
-    # Draw bot info
-    text_x = padding + 100
-    bot_name = clean_markdown(bot_info.get('name', 'Bot'))
-    draw_text_with_style(draw, (text_x, y_offset), bot_name, title_font, hex_to_rgb(theme.get('title_color', '#333333')),
-                        bold=fonts_config.get('title_bold', False))
-
-    y_offset += 40
-    bot_qq = bot_info.get('qq', '')
-    if bot_qq:
-        draw_text_with_style(draw, (text_x, y_offset), f"QQ: {bot_qq}", subtitle_font, hex_to_rgb(theme.get('subtitle_color', '#666666')),
-                            bold=fonts_config.get('content_bold', False))
-
-    y_offset += 30
-    description = bot_info.get('description', '')
-    if description:
-        draw_text_with_style(draw, (text_x, y_offset), description, card_desc_font, hex_to_rgb(theme.get('subtitle_color', '#666666')),
-                            bold=fonts_config.get('content_bold', False))
-
-    y_offset += 25
-    notice = bot_info.get('notice', '')
-    if notice:
-        draw_text_with_style(draw, (text_x, y_offset), notice, card_desc_font, hex_to_rgb(theme.get('subtitle_color', '#666666')),
-                            bold=fonts_config.get('content_bold', False))
-
-    y_offset = header_height
-
-    # Draw sections
-    for section in sections:
-        section_name = clean_markdown(section.get('name', ''))
-        items = section.get('items', [])
-
-        # Draw section title
-        draw_text_with_style(draw, (padding, y_offset), section_name, subtitle_font, hex_to_rgb(theme.get('title_color', '#333333')),
-                            bold=fonts_config.get('content_bold', False))
-        y_offset += section_title_height
-
-        # Draw items
-        for idx, item in enumerate(items):
-            row = idx // items_per_row
-            col = idx % items_per_row
-
-            x = padding + col * (card_width + spacing)
-            y = y_offset + row * (card_height + spacing)
-
-            # Draw card background
-            card_bg = hex_to_rgb(theme.get('card_background', '#ffffff'))
-            card_border = hex_to_rgb(theme.get('card_border', '#e0e0e0'))
-            draw_rounded_rectangle(draw, [x, y, x + card_width, y + card_height], 10, fill=card_bg, outline=card_border, width=2)
-
-            # Draw icon (if exists) - without background circle
-            icon_text = item.get('icon', '')
-            has_icon = bool(icon_text)
-
-            if has_icon:
-                # Icon should be vertically centered on the left side
-                icon_x = x + 15
-                icon_y = y + (card_height - 24) // 2  # Center the icon vertically
-                try:
-                    draw.text((icon_x, icon_y), icon_text, font=emoji_font,
-                             fill=hex_to_rgb(theme.get('card_title_color', '#444444')))
-                except Exception as e:
-                    print(f"Icon rendering fallback: {e}")
-                    draw.text((icon_x, icon_y), icon_text, font=card_desc_font,
-                             fill=hex_to_rgb(theme.get('card_title_color', '#444444')))
-
-            # Draw item name - positioned to the right of icon
-            item_name = clean_markdown(item.get('name', ''))
-            name_x = x + 50 if has_icon else x + 15
-            name_y = y + 12
-            draw_text_with_markdown(draw, (name_x, name_y), item_name, card_title_font, hex_to_rgb(theme.get('card_title_color', '#444444')),
-                                   bold=fonts_config.get('content_bold', False))
-
-            # Draw description - aligned with name
-            item_desc = clean_markdown(item.get('description', ''))
-            desc_x = x + 50 if has_icon else x + 15
-            desc_y = y + 32
-            draw_text_with_markdown(draw, (desc_x, desc_y), item_desc, card_desc_font, hex_to_rgb(theme.get('card_desc_color', '#888888')),
-                                   bold=fonts_config.get('content_bold', False))
-
-            # Draw usage if available
-            item_usage = item.get('usage', '')
-            if item_usage:
-                usage_x = x + 50 if has_icon else x + 15
-                usage_y = y + 51
-                # Use smaller font for usage (0.85x of desc font)
-                try:
-                    usage_font_size = max(8, int(fonts_config.get('card_desc_size', 12) * 0.85))
-                    usage_font = get_font(fonts_config.get('content_font', None), usage_font_size)
-                except:
-                    usage_font = card_desc_font
-
-                # Draw with slightly lighter color
-                desc_color = hex_to_rgb(theme.get('card_desc_color', '#888888'))
-                usage_color = tuple(min(255, c + 25) for c in desc_color)
-                usage_text = f"用法: {item_usage}"
-                draw.text((usage_x, usage_y), usage_text, font=usage_font, fill=usage_color)
-
-        y_offset += (card_height + spacing) * ((len(items) + items_per_row - 1) // items_per_row) + spacing
-
-    # Draw corner badge if exists
-    corner_badge = bot_info.get('corner_badge', '')
-    if corner_badge:
-        # Use smaller font for corner badge
-        badge_font_size = min(fonts_config.get('card_desc_size', 12), 11)
-        badge_font = get_font(fonts_config.get('content_font', None), badge_font_size)
-
-        # Calculate badge dimensions
-        try:
-            bbox = badge_font.getbbox(corner_badge)
-            badge_text_width = bbox[2] - bbox[0]
-            badge_text_height = bbox[3] - bbox[1]
-        except:
-            badge_text_width = len(corner_badge) * badge_font_size * 0.6
-            badge_text_height = badge_font_size
 
-        # Badge padding
-        badge_padding_x = 12
-        badge_padding_y = 6
-        badge_width = badge_text_width + badge_padding_x * 2
-        badge_height = badge_text_height + badge_padding_y * 2
+file_watcher = FileWatcher(app.config['WATCH_DEBOUNCE'])
 
-        # Position in top-right corner (8px from edges)
-        badge_x = total_width - 8 - badge_width
-        badge_y = 8
 
-        # Draw badge background (semi-transparent white)
-        badge_bg = Image.new('RGBA', (int(badge_width), int(badge_height)), (255, 255, 255, 230))
+def job_status(job):
+    """Public (JSON-serializable) view of a render job"""
+    status = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'format': job['format'],
+        'created': job['created'],
+        'started': job['started'],
+        'finished': job['finished'],
+    }
+    if job['status'] == 'done':
+        status.update({'cached': job['cached'], 'bytes': len(job['data']), 'encode': job['encode']})
+    if job['error']:
+        status['error'] = job['error']
+    return status
 
-        # Convert main image to RGBA if needed to support transparency
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
 
-        # Paste badge background with transparency
-        image.paste(badge_bg, (int(badge_x), int(badge_y)), badge_bg)
+# Routes
+@app.before_request
+def start_request_metrics():
+    """Start the request timer and, when asked for, the render stage trace"""
+    g.request_start = time.perf_counter()
+    if request.endpoint == 'generate_image' and (app.config['RENDER_TIMING_HEADER'] or
+                                                 request.args.get('timing') in ('1', 'true')):
+        g.render_timings = metrics.begin_trace()
 
-        # Re-create draw object after conversion
-        draw = ImageDraw.Draw(image)
 
-        # Draw badge text
-        text_x = badge_x + badge_padding_x
-        text_y = badge_y + badge_padding_y
-        subtitle_color = hex_to_rgb(theme.get('subtitle_color', '#666666'))
-        draw_text_with_markdown(draw, (text_x, text_y), corner_badge, badge_font, subtitle_color,
-                               bold=fonts_config.get('content_bold', False))
+@app.after_request
+def record_request_metrics(response):
+    """Record the request latency and add X-Render-Timing to traced renders"""
+    timings = g.get('render_timings')
+    if timings:
+        response.headers['X-Render-Timing'] = metrics.format_timings(timings)
+    if 'request_start' in g:
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - g.request_start,
+                        endpoint=request.endpoint or 'unknown', method=request.method, status=response.status_code)
+    return response
 
-    # Convert back to RGB if it was converted to RGBA
-    if image.mode == 'RGBA':
-        rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-        rgb_image.paste(image, mask=image.split()[3])
-        image = rgb_image
 
-    return image
+@app.teardown_request
+def end_render_trace(exc):
+    if g.pop('render_timings', None) is not None:
+        metrics.end_trace()
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics: render stage timings, cache hits/misses and request latency"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 
-# Routes
 @app.route('/')
 def index():
     """Main page"""
@@ -668,66 +1279,215 @@ def index():
 
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """Serve uploaded files"""
+    """Serve uploaded files (stored objects, aliases or plain files)"""
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     if not os.path.exists(filepath):
-        return jsonify({'success': False, 'error': 'File not found'}), 404
+        filepath = resolve_alias(app.config['UPLOAD_FOLDER'], filename)
+        if filepath is None:
+            return jsonify({'success': False, 'error': 'File not found'}), 404
     return send_file(filepath)
 
 
 @app.route('/fonts/<path:filename>')
 def font_file(filename):
     """Serve font files"""
-    return send_file(os.path.join(app.config['FONT_FOLDER'], filename))
+    filepath = resolve_alias(app.config['FONT_FOLDER'], filename)
+    return send_file(filepath or os.path.join(app.config['FONT_FOLDER'], filename))
+
 
+@app.route('/api/tenants', methods=['GET'])
+def list_tenants():
+    """List the tenants with their newest saved version"""
+    return jsonify({'success': True, 'tenants': tenants.list()})
 
-@app.route('/api/config', methods=['GET'])
-def get_config():
+
+# The config, generate and apply-theme routes serve config.yaml, and the same
+# routes under /api/tenants/<tenant>/ serve that tenant's config.
+@app.route('/api/config', methods=['GET'], defaults={'tenant': None})
+@app.route('/api/tenants/<tenant>/config', methods=['GET'])
+def get_config(tenant):
     """Get current configuration"""
-    config = load_config()
+    store, _ = tenant_store(tenant)
+    if store is None:
+        return tenant_not_found()
+    config, _ = store.load_version()
     if config:
         return jsonify({'success': True, 'config': config})
     return jsonify({'success': False, 'error': 'Failed to load config'})
 
 
-@app.route('/api/config', methods=['POST'])
-def update_config():
-    """Update configuration"""
+@app.route('/api/config', methods=['POST'], defaults={'tenant': None})
+@app.route('/api/tenants/<tenant>/config', methods=['POST'])
+def update_config(tenant):
+    """Update configuration (the first save creates a tenant)"""
     try:
         config = request.json
-        if save_config(config):
+        validate_config(config)
+        store, _ = tenant_store(tenant, create=True)
+        if store is None:
+            return jsonify({'success': False, 'error': 'Invalid tenant id'}), 400
+        if store.save(config):
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'Failed to save config'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
-@app.route('/api/generate', methods=['POST'])
-def generate_image():
-    """Generate help menu image"""
+@app.route('/api/config', methods=['PATCH'], defaults={'tenant': None})
+@app.route('/api/tenants/<tenant>/config', methods=['PATCH'])
+def patch_config(tenant):
+    """Apply a partial update to the config
+
+    The Content-Type picks the format: application/json-patch+json for a
+    JSON Patch (RFC 6902) list of operations, application/merge-patch+json
+    (or plain application/json) for a JSON Merge Patch (RFC 7386); anything
+    else answers 415. The patch is applied to the current config under the config's lock,
+    validated and saved; a failing operation leaves the config untouched
+    (a failed 'test' answers 409). The response has the new sha256 and the
+    changes (see config_changes), e.g. which sections need re-rendering.
+    """
     try:
-        config = load_config()
+        store, _ = tenant_store(tenant)
+        if store is None:
+            return tenant_not_found()
+        json_patch = request.mimetype == 'application/json-patch+json'
+        if not json_patch and request.mimetype not in ('application/merge-patch+json', 'application/json'):
+            return jsonify({'success': False, 'error': 'Send application/json-patch+json or '
+                                                       'application/merge-patch+json'}), 415
+        patch = request.get_json(silent=True)
+        if patch is None:
+            return jsonify({'success': False, 'error': 'The patch must be a JSON document'}), 400
+        if json_patch and not isinstance(patch, list):
+            return jsonify({'success': False, 'error': 'A JSON Patch must be a list of operations'}), 400
+
+        changes = {}
+
+        def modify(config):
+            before = copy.deepcopy(config)
+            if json_patch:
+                config = apply_json_patch(config, patch)
+            else:
+                config = apply_merge_patch(config, patch)
+            if isinstance(config, dict):
+                changes.update(config_changes(before, config))
+            return config
+
+        try:
+            config, digest = store.update(modify)
+        except PatchTestFailed as e:
+            return jsonify({'success': False, 'error': str(e)}), 409
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, 'sha256': digest, 'changed': changes})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/config/history', methods=['GET'], defaults={'tenant': None})
+@app.route('/api/tenants/<tenant>/config/history', methods=['GET'])
+def get_config_history(tenant):
+    """List the saved versions of the config, newest first"""
+    store, _ = tenant_store(tenant)
+    if store is None:
+        return tenant_not_found()
+    _, current = store.load_version()
+    return jsonify({'success': True, 'current': current, 'versions': store.history.list()})
+
+
+@app.route('/api/config/rollback/<version>', methods=['POST'], defaults={'tenant': None})
+@app.route('/api/tenants/<tenant>/config/rollback/<version>', methods=['POST'])
+def rollback_config(version, tenant):
+    """Restore a saved version of the config by its sha256 (or a unique prefix)"""
+    try:
+        store, _ = tenant_store(tenant)
+        if store is None:
+            return tenant_not_found()
+        digest, data = store.history.read(version)
+        if data is None:
+            return jsonify({'success': False, 'error': 'Version not found'}), 404
+        config = yaml.load(data, Loader=YamlLoader)
+        validate_config(config)
+        store.write_data(data, config)
+        return jsonify({'success': True, 'sha256': digest, 'config': config})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/generate', methods=['POST'], defaults={'tenant': None})
+@app.route('/api/tenants/<tenant>/generate', methods=['POST'])
+def generate_image(tenant):
+    """Generate help menu image
+
+    By default the image is returned base64-encoded inside JSON. With
+    ?response=binary the encoded bytes are returned directly with
+    Content-Length and an ETag. Encoder settings come from the config's
+    `output` section and can be overridden per request with query
+    parameters or an `output` object in the JSON body (see OUTPUT_DEFAULTS).
+    With ?timing=1 the per-stage render timings are returned in the
+    X-Render-Timing header.
+    """
+    try:
+        store, cache = tenant_store(tenant)
+        if store is None:
+            return tenant_not_found()
+        binary = request.args.get('response') == 'binary'
+        overrides = {key: request.args.get(key) for key in OUTPUT_DEFAULTS if key in request.args}
+        body = request.get_json(silent=True) or {}
+        overrides.update(body.get('output') or {})
+
+        with metrics.span('config'):
+            config, config_hash = store.load_version()
         if not config:
             return jsonify({'success': False, 'error': 'Failed to load config'})
 
-        print("Generating image...")
-        image = generate_help_image(config)
-
-        # Save image
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_path = os.path.join(app.config['OUTPUT_FOLDER'], f'help_menu_{timestamp}.png')
-        image.save(output_path, 'PNG')
-        print(f"Image saved to: {output_path}")
+        try:
+            options = resolve_output_options(config, overrides)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)})
+        mimetype, extension = IMAGE_FORMATS[options['format']]['mimetype'], IMAGE_FORMATS[options['format']]['extension']
+
+        cache_key = render_cache_key(config, options, config_hash)
+        if binary and cache_key in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{cache_key}"'})
+
+        encode_stats = None
+        cached = cache.get(cache_key)
+        if cached is not None:
+            data = cached['data']
+        else:
+            print("Generating image...")
+            image = generate_help_image(config)
+
+            # Encode once; the same bytes are saved and returned
+            data, encode_stats = encode_image(image, options)
+
+        # Identical images share one file in the output store; this also moves the latest pointer
+        with metrics.span('write'):
+            output_name = f'tenant-{tenant}' if tenant else os.path.splitext(CONFIG_FILE)[0]
+            output_path = output_store.save(data, extension, output_name)
+        if cached is None:
+            print(f"Image saved to: {output_path} ({encode_stats['bytes']} bytes, {encode_stats['encode_ms']} ms encode)")
+            cache.put(cache_key, data, output_path)
+
+        if binary:
+            response = Response(data, mimetype=mimetype)
+            response.set_etag(cache_key)
+            response.headers['Content-Length'] = str(len(data))
+            response.headers['X-Output-Path'] = output_path
+            response.headers['X-Render-Cache'] = 'hit' if cached is not None else 'miss'
+            if encode_stats:
+                response.headers['X-Encode-Time'] = str(encode_stats['encode_ms'])
+            return response
 
         # Convert to base64 for preview
-        buffered = io.BytesIO()
-        image.save(buffered, format='PNG')
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        img_str = base64.b64encode(data).decode()
 
         return jsonify({
             'success': True,
-            'image': f'data:image/png;base64,{img_str}',
-            'path': output_path
+            'image': f'data:{mimetype};base64,{img_str}',
+            'path': output_path,
+            'cached': cached is not None,
+            'encode': encode_stats or {'format': options['format'], 'bytes': len(data), 'encode_ms': 0}
         })
     except Exception as e:
         import traceback
@@ -736,6 +1496,278 @@ def generate_image():
         return jsonify({'success': False, 'error': str(e)})
 
 
+@app.route('/api/preview', methods=['POST'])
+def preview_image():
+    """Render a quick, downscaled preview of a config and return the image bytes
+
+    Body (optional): {"config": {...}, "scale": 0.5, "output": {...}}. The
+    config defaults to config.yaml; the editor sends its unsaved state. The
+    menu goes through the normal layout and layer caches, so the preview
+    matches the final image exactly. scale (at most 1) is relative to the
+    final image (layout.scale): the menu is drawn directly at the target
+    scale when that is 1x or more, otherwise drawn at 1x and shrunk, and
+    then encoded with PREVIEW_OUTPUT. Nothing is written to output/ or to
+    the disk tier of the render cache.
+    """
+    try:
+        body = request.get_json(silent=True) or {}
+        config, config_hash = body.get('config'), None
+        if not config:
+            config, config_hash = load_config_version()
+        if not config:
+            return jsonify({'success': False, 'error': 'Failed to load config'})
+
+        try:
+            validate_config(config)
+            scale = min(max(float(body.get('scale') or app.config['PREVIEW_SCALE']), 0.05), 1.0)
+            options = resolve_output_options(None, {**app.config['PREVIEW_OUTPUT'], **(body.get('output') or {})})
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)})
+
+        cache_key = render_cache_key(config, {'preview': scale, **options}, config_hash)
+        cached = get_render_cache().get(cache_key)
+        if cached is not None:
+            data = cached['data']
+        else:
+            target_scale = layout_scale(config) * scale
+            render_scale = max(target_scale, 1)
+            image = downscale_image(generate_help_image(config, scale=render_scale), target_scale / render_scale)
+            data, _ = encode_image(image, options)
+            get_render_cache().put(cache_key, data, persist=False)
+
+        response = Response(data, mimetype=IMAGE_FORMATS[options['format']]['mimetype'])
+        response.headers['Content-Length'] = str(len(data))
+        response.headers['X-Render-Cache'] = 'hit' if cached is not None else 'miss'
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/generate/batch', methods=['POST'])
+def generate_batch():
+    """Generate images for many configs without touching config.yaml
+
+    Body: {"configs": [config, ...]}, optional "workers" and "stream". With
+    stream, results are sent as newline-delimited JSON in completion order.
+    Config file paths are only accepted by render_batch() in Python, never
+    over HTTP.
+    """
+    try:
+        payload = request.json or {}
+        if 'files' in payload:
+            return jsonify({'success': False, 'error': 'Config files cannot be rendered over HTTP, send configs'}), 400
+        sources = payload.get('configs', [])
+        if not isinstance(sources, list) or not all(isinstance(source, dict) for source in sources):
+            return jsonify({'success': False, 'error': 'configs must be a list of config objects'}), 400
+        if not sources:
+            return jsonify({'success': False, 'error': 'No configs provided'})
+        try:
+            workers = batch_workers(payload.get('workers'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        return batch_response(sources, workers, payload.get('stream'))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+def batch_workers(value):
+    """Worker count requested in a body, clamped to 1..BATCH_WORKERS (the default)"""
+    if value is None:
+        return app.config['BATCH_WORKERS']
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('workers must be a whole number')
+    return min(max(value, 1), app.config['BATCH_WORKERS'])
+
+
+def batch_response(sources, workers=None, stream=False):
+    """Render sources with render_batch into a JSON (or NDJSON stream) response"""
+    def to_json(result):
+        if result['success']:
+            img_str = base64.b64encode(result.pop('data')).decode()
+            result['image'] = f"data:{IMAGE_FORMATS[result['format']]['mimetype']};base64,{img_str}"
+        return result
+
+    if stream:
+        def generate():
+            for result in render_batch(sources, workers):
+                yield json.dumps(to_json(result), ensure_ascii=False) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    results = sorted((to_json(r) for r in render_batch(sources, workers)), key=lambda r: r['index'])
+    return jsonify({'success': all(r['success'] for r in results), 'results': results})
+
+
+def page_height_for(config, requested=None):
+    """Page height in pixels: the requested one, else layout.page_height, else PAGE_HEIGHT"""
+    return int(requested or (config.get('layout') or {}).get('page_height') or app.config['PAGE_HEIGHT'])
+
+
+def load_pages():
+    """Load config.yaml split into pages; returns (page height, page configs) or (None, None)"""
+    config = load_config()
+    if not config:
+        return None, None
+    page_height = page_height_for(config, request.args.get('page_height', type=int))
+    return page_height, paginate_config(config, page_height)
+
+
+@app.route('/api/pages', methods=['GET'])
+def list_pages():
+    """Describe the pages of the paginated menu without rendering them
+
+    Pages are at most ?page_height= (or layout.page_height, or PAGE_HEIGHT)
+    pixels tall; each one is rendered on request by /api/pages/<n>.
+    """
+    try:
+        page_height, pages = load_pages()
+        if pages is None:
+            return jsonify({'success': False, 'error': 'Failed to load config'})
+
+        results = []
+        for number, page in enumerate(pages, 1):
+            layout = scale_layout(compute_layout(page), layout_scale(page))
+            results.append({
+                'page': number,
+                'width': layout['width'],
+                'height': layout['height'],
+                'sections': [section.get('name', '') for section in page['sections']],
+                'items': sum(len(section.get('items', [])) for section in page['sections']),
+                'url': f'/api/pages/{number}?page_height={page_height}',
+            })
+        return jsonify({'success': True, 'page_height': page_height, 'pages': results})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/pages/<int:number>', methods=['GET'])
+def get_page(number):
+    """Render one page (1-based) of the paginated menu and return the encoded image
+
+    Encoder options come from the config's output section and query
+    parameters, as for /api/generate. Pages go through the render cache and
+    carry an ETag.
+    """
+    try:
+        page_height, pages = load_pages()
+        if pages is None:
+            return jsonify({'success': False, 'error': 'Failed to load config'})
+        if not 1 <= number <= len(pages):
+            return jsonify({'success': False, 'error': 'Page not found'}), 404
+
+        page = pages[number - 1]
+        overrides = {key: request.args.get(key) for key in OUTPUT_DEFAULTS if key in request.args}
+        try:
+            options = resolve_output_options(page, overrides)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)})
+
+        cache_key = render_cache_key(page, options)
+        if cache_key in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{cache_key}"'})
+
+        data, _, cached = render_encoded(page, options)
+        response = Response(data, mimetype=IMAGE_FORMATS[options['format']]['mimetype'])
+        response.set_etag(cache_key)
+        response.headers['Content-Length'] = str(len(data))
+        response.headers['X-Page-Count'] = str(len(pages))
+        response.headers['X-Render-Cache'] = 'hit' if cached else 'miss'
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/generate/pages', methods=['POST'])
+def generate_pages():
+    """Render every page of the paginated menu in parallel
+
+    Body (optional): {"page_height": n, "workers": n, "stream": bool}.
+    The response has the same shape as /api/generate/batch, one result per
+    page in page order (or in completion order when streamed).
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        config = load_config()
+        if not config:
+            return jsonify({'success': False, 'error': 'Failed to load config'})
+        try:
+            workers = batch_workers(payload.get('workers'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        pages = paginate_config(config, page_height_for(config, payload.get('page_height')))
+        return batch_response(pages, workers, payload.get('stream'))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a render and return its job id immediately
+
+    Body (optional): {"config": {...}, "output": {...}}; without a config
+    the current config.yaml is rendered. Identical in-flight jobs are
+    shared; a full queue answers 429.
+    """
+    try:
+        body = request.get_json(silent=True) or {}
+        config, config_hash = body.get('config'), None
+        if not config:
+            config, config_hash = load_config_version()
+        if not config:
+            return jsonify({'success': False, 'error': 'Failed to load config'})
+
+        try:
+            options = resolve_output_options(config, body.get('output'))
+            job, deduplicated = render_jobs.submit(config, options, config_hash)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)})
+        except queue.Full:
+            response = jsonify({'success': False, 'error': 'Render queue is full, retry later'})
+            response.headers['Retry-After'] = '1'
+            return response, 429
+
+        return jsonify({'success': True, 'deduplicated': deduplicated, **job_status(job)}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of a render job"""
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, **job_status(job)})
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Get the rendered image of a job, long-polling up to ?wait= seconds
+
+    Returns the image bytes when done (or base64 JSON with ?response=json),
+    202 with the job status if it is still pending after the wait.
+    """
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+
+    wait = min(max(request.args.get('wait', 0, type=float), 0), app.config['JOB_MAX_WAIT'])
+    job['done'].wait(wait)
+
+    if job['status'] == 'failed':
+        return jsonify({'success': False, **job_status(job)})
+    if job['status'] != 'done':
+        return jsonify({'success': True, **job_status(job)}), 202
+
+    mimetype = IMAGE_FORMATS[job['format']]['mimetype']
+    if request.args.get('response') == 'json':
+        img_str = base64.b64encode(job['data']).decode()
+        return jsonify({'success': True, 'image': f'data:{mimetype};base64,{img_str}', **job_status(job)})
+
+    response = Response(job['data'], mimetype=mimetype)
+    response.set_etag(job['key'])
+    response.headers['Content-Length'] = str(len(job['data']))
+    return response
 
 
 @app.route('/api/upload/<file_type>', methods=['POST'])
@@ -755,15 +1787,18 @@ def upload_file(file_type):
         else:
             folder = app.config['UPLOAD_FOLDER']
 
-        # Save file
-        filename = file.filename
-        filepath = os.path.join(folder, filename)
-        file.save(filepath)
+        # Store by content hash; the original filename is kept as an alias
+        filename = os.path.basename(file.filename)
+        filepath, digest = store_upload(file.stream, folder, filename)
+
+        if file_type == 'font':
+            invalidate_font_cache(filename)
 
         return jsonify({
             'success': True,
             'path': filepath,
-            'filename': filename
+            'filename': filename,
+            'sha256': digest
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -776,6 +1811,8 @@ def list_fonts():
         fonts = []
         if os.path.exists(app.config['FONT_FOLDER']):
             fonts = [f for f in os.listdir(app.config['FONT_FOLDER']) if f.endswith('.ttf') or f.endswith('.otf')]
+        # Uploaded fonts are listed by their alias names
+        fonts += [f for f in load_aliases(app.config['FONT_FOLDER']) if f not in fonts]
         return jsonify({'success': True, 'fonts': ['default'] + fonts})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -787,42 +1824,44 @@ def list_themes():
     return jsonify({'success': True, 'themes': PRESET_THEMES})
 
 
-@app.route('/api/apply-theme/<theme_name>', methods=['POST'])
-def apply_theme(theme_name):
-    """Apply a preset theme"""
+@app.route('/api/apply-theme/<theme_name>', methods=['POST'], defaults={'tenant': None})
+@app.route('/api/tenants/<tenant>/apply-theme/<theme_name>', methods=['POST'])
+def apply_theme(theme_name, tenant):
+    """Apply a preset theme (read, modified and saved under the config's lock)"""
     try:
         if theme_name not in PRESET_THEMES:
             return jsonify({'success': False, 'error': 'Theme not found'})
 
-        config = load_config()
-        if not config:
-            return jsonify({'success': False, 'error': 'Failed to load config'})
-
-        # Update theme settings
-        theme_data = PRESET_THEMES[theme_name]
-        if 'theme' not in config:
-            config['theme'] = {}
-
-        config['theme'].update({
-            'name': theme_name,
-            'background_type': 'gradient',
-            'background_gradient': theme_data['background_gradient'],
-            'angle': theme_data.get('angle', 135),
-            'card_background': theme_data['card_background'],
-            'card_border': theme_data['card_border'],
-            'title_color': theme_data['title_color'],
-            'subtitle_color': theme_data['subtitle_color'],
-            'card_title_color': theme_data['title_color'],
-            'card_desc_color': theme_data['subtitle_color'],
-        })
-
-        if save_config(config):
-            return jsonify({'success': True, 'config': config})
-        return jsonify({'success': False, 'error': 'Failed to save config'})
+        store, _ = tenant_store(tenant)
+        if store is None:
+            return tenant_not_found()
+        config, _ = store.update(lambda config: set_theme(config, theme_name))
+        return jsonify({'success': True, 'config': config})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
+def set_theme(config, theme_name):
+    """Replace the theme settings of a config with a preset theme"""
+    # Update theme settings
+    theme_data = PRESET_THEMES[theme_name]
+    if 'theme' not in config:
+        config['theme'] = {}
+
+    config['theme'].update({
+        'name': theme_name,
+        'background_type': 'gradient',
+        'background_gradient': theme_data['background_gradient'],
+        'angle': theme_data.get('angle', 135),
+        'card_background': theme_data['card_background'],
+        'card_border': theme_data['card_border'],
+        'title_color': theme_data['title_color'],
+        'subtitle_color': theme_data['subtitle_color'],
+        'card_title_color': theme_data['title_color'],
+        'card_desc_color': theme_data['subtitle_color'],
+    })
+
+
 if __name__ == '__main__':
     # Load config on startup
     load_config()
@@ -834,4 +1873,11 @@ if __name__ == '__main__':
     print("Press Ctrl+C to quit")
     print("=" * 50)
 
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    debug = True
+    # The debug reloader runs this block twice; only its serving process watches files
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        output_store.start()
+        if app.config['WATCH_FILES']:
+            file_watcher.start()
+
+    app.run(debug=debug, host='0.0.0.0', port=5000)
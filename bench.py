@@ -0,0 +1,265 @@
+"""Benchmark the render pipeline across a matrix of configs
+
+    python bench.py                   # quick matrix, compared against bench_baseline.json
+    python bench.py --full            # every combination of the matrix
+    python bench.py --save-baseline   # record the current numbers as the baseline
+
+Runs offline: system fonts are disabled (Pillow's bundled font is used) and
+the avatar, logo and background image are generated into a temporary folder.
+"""
+import argparse
+import copy
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image, ImageDraw
+
+import renderer
+
+BASELINE_FILE = 'bench_baseline.json'
+ITEM_COUNTS = [5, 50, 500]
+ITEMS_PER_SECTION = 10
+STAGES = ['layout', 'fonts', 'background', 'render_cold', 'render_warm', 'render_edit', 'encode']
+
+
+def make_assets(folder):
+    """Generate the avatar, logo and background image used by the matrix"""
+    avatar = Image.new('RGBA', (256, 256), (30, 144, 255, 255))
+    ImageDraw.Draw(avatar).ellipse([24, 24, 232, 232], fill=(255, 200, 0, 160))
+    avatar_path = os.path.join(folder, 'avatar.png')
+    avatar.save(avatar_path)
+
+    logo = Image.new('RGBA', (400, 200), (0, 0, 0, 0))
+    ImageDraw.Draw(logo).rounded_rectangle([8, 8, 392, 192], 40, fill=(200, 30, 60, 200))
+    logo_path = os.path.join(folder, 'logo.png')
+    logo.save(logo_path)
+
+    background = renderer.create_gradient_background(1600, 2400, ['#203a43', '#2c5364', '#ffd6e0'], 60)
+    ImageDraw.Draw(background).ellipse([200, 300, 1400, 1500], fill=(255, 255, 255))
+    background_path = os.path.join(folder, 'background.jpg')
+    background.save(background_path, quality=90)
+
+    return {'avatar': avatar_path, 'logo': logo_path, 'background': background_path}
+
+
+def make_config(items, theme, bold, background, avatar, badge, assets):
+    """Build a menu config with `items` cards spread over sections of ITEMS_PER_SECTION"""
+    theme_data = renderer.PRESET_THEMES[theme]
+    theme = {
+        'name': theme,
+        'background_type': 'image' if background else 'gradient',
+        'background_color': '#f5f5f5',
+        'background_gradient': theme_data['background_gradient'],
+        'angle': theme_data.get('angle', 135),
+        'background_image': assets['background'] if background else '',
+        'card_background': theme_data['card_background'],
+        'card_border': theme_data['card_border'],
+        'title_color': theme_data['title_color'],
+        'subtitle_color': theme_data['subtitle_color'],
+        'card_title_color': theme_data['title_color'],
+        'card_desc_color': theme_data['subtitle_color'],
+    }
+
+    sections = []
+    for start in range(0, items, ITEMS_PER_SECTION):
+        sections.append({
+            'name': f"Section {len(sections) + 1}",
+            'items': [{
+                'name': f"Command {index}",
+                'icon': '⭐',
+                'description': f"Runs **command {index}** with the [documented](https://example.com) options",
+                'usage': f"/command{index} <arg>",
+            } for index in range(start, min(start + ITEMS_PER_SECTION, items))],
+        })
+
+    return {
+        'bot_info': {
+            'name': 'Benchmark Bot',
+            'qq': '10000',
+            'description': 'A generated menu used to benchmark the render pipeline.',
+            'notice': 'Numbers are only comparable on the same machine.',
+            'corner_badge': 'by bench' if badge else '',
+            'corner_badge_position': 'bottom-right',
+            'avatar': assets['avatar'] if avatar else '',
+            'logo': assets['logo'] if avatar else '',
+        },
+        'layout': {'items_per_row': 3, 'card_width': 200, 'card_height': 80, 'padding': 20, 'spacing': 15},
+        'theme': theme,
+        'fonts': {'title_font': 'default', 'content_font': 'default', 'title_size': 32, 'subtitle_size': 18,
+                  'card_title_size': 16, 'card_desc_size': 12, 'content_bold': bold},
+        'sections': sections,
+    }
+
+
+def build_matrix(full, item_counts):
+    """Yield the parameters of every benchmark case
+
+    The quick matrix covers every item count and every preset theme with the
+    defaults, then toggles each feature on its own. --full runs the whole
+    cartesian product.
+    """
+    themes = list(renderer.PRESET_THEMES)
+    features = ['bold', 'background', 'avatar', 'badge']
+    if full:
+        for items, theme, *flags in itertools.product(item_counts, themes, *[(False, True)] * len(features)):
+            yield dict(items=items, theme=theme, **dict(zip(features, flags)))
+        return
+
+    defaults = dict(bold=False, background=False, avatar=False, badge=False)
+    for items in item_counts:
+        yield dict(items=items, theme='default', **defaults)
+    middle = item_counts[len(item_counts) // 2]
+    for theme in themes[1:]:
+        yield dict(items=middle, theme=theme, **defaults)
+    for feature in features:
+        for items in item_counts:
+            yield dict(items=items, theme='default', **dict(defaults, **{feature: True}))
+
+
+def case_name(params):
+    flags = [feature for feature in ('bold', 'background', 'avatar', 'badge') if params[feature]]
+    return '/'.join([f"{params['items']}items", params['theme']] + flags)
+
+
+def peak_rss_kb():
+    """Process peak RSS in KB since the last reset_peak_rss (Linux only, else None)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run_case(config, repeat, workers):
+    """Time each stage of one config; returns the best time per stage plus peak memory"""
+    timings = {stage: [] for stage in STAGES}
+
+    for run in range(repeat):
+        # Isolated stage costs, each from cold caches
+        renderer.clear_render_caches()
+        layout, ms = timed(renderer.compute_layout, config)
+        timings['layout'].append(ms)
+        _, ms = timed(renderer.load_render_style, config)
+        timings['fonts'].append(ms)
+        _, ms = timed(renderer.render_background, config, layout['width'], layout['height'])
+        timings['background'].append(ms)
+
+        # Peak memory of a cold render, measured separately since tracemalloc slows it down
+        if run == 0:
+            renderer.clear_render_caches()
+            reset_peak_rss()
+            tracemalloc.start()
+            renderer.generate_help_image(config, workers=workers)
+            py_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            rss_peak = peak_rss_kb()
+
+        # End to end: cold, fully cached, and after editing one card
+        renderer.clear_render_caches()
+        image, ms = timed(renderer.generate_help_image, config, workers=workers)
+        timings['render_cold'].append(ms)
+
+        _, ms = timed(renderer.generate_help_image, config, workers=workers)
+        timings['render_warm'].append(ms)
+
+        edited = copy.deepcopy(config)
+        edited['sections'][0]['items'][0]['description'] += ' (edited)'
+        _, ms = timed(renderer.generate_help_image, edited, workers=workers)
+        timings['render_edit'].append(ms)
+
+        _, ms = timed(renderer.encode_image, image)
+        timings['encode'].append(ms)
+
+    result = {stage: round(min(values), 2) for stage, values in timings.items()}
+    result['size'] = list(image.size)
+    result['py_peak_kb'] = py_peak // 1024
+    result['rss_peak_kb'] = rss_peak
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Print each case's change against the baseline; returns the number of regressions"""
+    regressions = 0
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        changes = []
+        for stage in ('render_cold', 'render_warm', 'encode'):
+            if not base.get(stage):
+                continue
+            ratio = result[stage] / base[stage]
+            changes.append(f"{stage} {ratio:.2f}x")
+            if ratio > 1 + threshold:
+                regressions += 1
+                changes[-1] += ' REGRESSION'
+        print(f"  {name}: {', '.join(changes)}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the help menu render pipeline.')
+    parser.add_argument('--full', action='store_true', help='run every combination of the matrix')
+    parser.add_argument('--items', type=int, nargs='+', default=ITEM_COUNTS, help='item counts (default: 5 50 500)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the best time is reported')
+    parser.add_argument('--workers', type=int, default=0, help='section worker processes (0 = sequential)')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help=f"baseline file (default: {BASELINE_FILE})")
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='slowdown reported as a regression (default: 0.25)')
+    parser.add_argument('--system-fonts', action='store_true', help='use system fonts instead of the bundled font')
+    args = parser.parse_args(argv)
+
+    renderer.settings['SYSTEM_FONTS'] = args.system_fonts
+    renderer.settings['FONT_FOLDER'] = tempfile.mkdtemp(prefix='bench-fonts-')
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench-assets-') as folder:
+        assets = make_assets(folder)
+        print(f"{'case':<48} " + ' '.join(f"{stage:>11}" for stage in STAGES) + f" {'py_peak_kb':>11} {'rss_peak_kb':>11}")
+        for params in build_matrix(args.full, sorted(args.items)):
+            name = case_name(params)
+            config = make_config(assets=assets, **params)
+            result = run_case(config, args.repeat, args.workers)
+            results[name] = result
+            print(f"{name:<48} " + ' '.join(f"{result[stage]:>11.2f}" for stage in STAGES)
+                  + f" {result['py_peak_kb']:>11} {str(result['rss_peak_kb']):>11}", flush=True)
+    os.rmdir(renderer.settings['FONT_FOLDER'])
+
+    regressions = 0
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline} (times in ms are best of {args.repeat}):")
+        regressions = compare(results, baseline, args.threshold)
+        print(f"{regressions} regression(s) over {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Render help menu images from YAML configs without starting the web server
+
+    python cli.py config.yaml
+    python cli.py menus/*.yaml -o build --format webp
+    python cli.py config.yaml --page-height 3000
+    python cli.py config.yaml --scale 1 2 3
+    cat config.yaml | python cli.py - -o build
+"""
+import time
+
+start_time = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+import renderer
+
+import_time = time.perf_counter() - start_time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Render help menu images from YAML configs.')
+    parser.add_argument('configs', nargs='+', help="YAML config files, or '-' to read one from stdin")
+    parser.add_argument('-o', '--output-dir', default='output', help='directory for the rendered images (default: output)')
+    parser.add_argument('--font-folder', default=renderer.settings['FONT_FOLDER'],
+                        help='folder with uploaded fonts (default: fonts)')
+    parser.add_argument('--format', choices=sorted(renderer.IMAGE_FORMATS) + ['jpg'], help='output format')
+    parser.add_argument('--compress-level', type=int, help='PNG zlib level 0-9')
+    parser.add_argument('--colors', type=int, help='PNG adaptive palette size (2-256), 0 keeps full RGB')
+    parser.add_argument('--quality', type=int, help='WebP/JPEG quality 1-100')
+    parser.add_argument('--optimize', action='store_true', default=None, help='extra PNG/JPEG optimization pass')
+    parser.add_argument('--page-height', type=int, default=0,
+                        help='split each menu into pages at most this many pixels tall at the largest '
+                             'render scale (written as name-1, name-2, ...)')
+    parser.add_argument('--scale', type=float, nargs='+',
+                        help='render at these scales from one layout pass (written as name@2x, ...); '
+                             'default: layout.scale')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes for sections (0 = sequential)')
+    parser.add_argument('--timing', action='store_true', help='print cold start and per-file timings')
+    args = parser.parse_args(argv)
+    if args.scale and not all(0 < scale <= renderer.MAX_SCALE for scale in args.scale):
+        parser.error(f"--scale values must be between 0 and {renderer.MAX_SCALE}")
+    return args
+
+
+def output_name(path, extension, page=None, scale=None):
+    """Name the image after its config file (and page number and scale)"""
+    name = 'help_menu' if path == '-' else os.path.splitext(os.path.basename(path))[0]
+    if page is not None:
+        name = f"{name}-{page}"
+    if scale is not None and scale != 1:
+        name = f"{name}@{scale:g}x"
+    return f"{name}.{extension}"
+
+
+def render_file(path, args, overrides):
+    """Render one config file (one image per page and scale); returns (output paths, stats)"""
+    config = renderer.load_config_file(path)
+    renderer.validate_config(config)
+    options = renderer.resolve_output_options(config, overrides)
+    extension = renderer.IMAGE_FORMATS[options['format']]['extension']
+    if args.page_height:
+        page_scale = max(args.scale) if args.scale else None
+        pages = list(enumerate(renderer.paginate_config(config, args.page_height, page_scale), 1))
+    else:
+        pages = [(None, config)]
+
+    output_paths = []
+    stats = {'bytes': 0, 'encode_ms': 0}
+    for page, page_config in pages:
+        if args.scale:
+            images = renderer.generate_help_images(page_config, args.scale, workers=args.workers)
+        else:
+            images = {None: renderer.generate_help_image(page_config, workers=args.workers)}
+
+        for scale, image in images.items():
+            data, image_stats = renderer.encode_image(image, options)
+            stats['bytes'] += image_stats['bytes']
+            stats['encode_ms'] = round(stats['encode_ms'] + image_stats['encode_ms'], 2)
+
+            output_path = os.path.join(args.output_dir, output_name(path, extension, page, scale))
+            with open(output_path, 'wb') as f:
+                f.write(data)
+            output_paths.append(output_path)
+    return output_paths, stats
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    renderer.settings['FONT_FOLDER'] = args.font_folder
+    os.makedirs(args.output_dir, exist_ok=True)
+    overrides = {'format': args.format, 'compress_level': args.compress_level, 'colors': args.colors,
+                 'quality': args.quality, 'optimize': args.optimize}
+
+    if args.timing:
+        print(f"import: {import_time * 1000:.1f} ms", file=sys.stderr)
+
+    failed = 0
+    for index, path in enumerate(args.configs):
+        file_start = time.perf_counter()
+        try:
+            output_paths, stats = render_file(path, args, overrides)
+        except Exception as e:
+            print(f"Error rendering {path}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        print('\n'.join(output_paths))
+        if args.timing:
+            elapsed = (time.perf_counter() - file_start) * 1000
+            label = 'cold start' if index == 0 else 'render'
+            print(f"{label}: {path} {elapsed:.1f} ms ({stats['bytes']} bytes, {stats['encode_ms']} ms encode)",
+                  file=sys.stderr)
+
+    if args.timing:
+        print(f"total: {(time.perf_counter() - start_time) * 1000:.1f} ms", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Render instrumentation: stage timing spans, cache counters and latency histograms
+
+Metrics are kept in process and exposed in the Prometheus text format by
+render_prometheus(). With settings['ENABLED'] False nothing is recorded
+and a span costs one attribute lookup, unless begin_trace() is collecting
+per-render timings for the current thread.
+"""
+import threading
+import time
+from contextlib import nullcontext
+
+settings = {
+    'ENABLED': True,
+}
+
+# Histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name: (type, help)
+METRICS = {
+    'render_stage_seconds': ('histogram', 'Time spent in each render stage'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result'),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+}
+
+counters = {}
+histograms = {}
+metrics_lock = threading.Lock()
+local = threading.local()
+NULL_SPAN = nullcontext()
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def count(name, amount=1, **labels):
+    """Increment a counter"""
+    if not settings['ENABLED']:
+        return
+    key = (name, label_key(labels))
+    with metrics_lock:
+        counters[key] = counters.get(key, 0) + amount
+
+
+def count_cache(cache, hit):
+    """Count a cache lookup as a hit or a miss"""
+    if settings['ENABLED']:
+        count('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def observe(name, value, **labels):
+    """Record a value (in seconds) in a histogram"""
+    if not settings['ENABLED']:
+        return
+    key = (name, label_key(labels))
+    with metrics_lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram['buckets'][index] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+class Span:
+    """Times a render stage into the stage histogram and the thread's trace"""
+    __slots__ = ('stage', 'timings', 'start')
+
+    def __init__(self, stage, timings):
+        self.stage = stage
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if self.timings is not None:
+            self.timings[self.stage] = self.timings.get(self.stage, 0.0) + elapsed
+        observe('render_stage_seconds', elapsed, stage=self.stage)
+        return False
+
+
+def span(stage):
+    """Context manager timing one stage; a no-op when disabled and not tracing"""
+    timings = getattr(local, 'timings', None)
+    if timings is None and not settings['ENABLED']:
+        return NULL_SPAN
+    return Span(stage, timings)
+
+
+def begin_trace():
+    """Start collecting the stage timings (seconds) of the spans run by this thread"""
+    local.timings = {}
+    return local.timings
+
+
+def end_trace():
+    """Stop collecting stage timings for this thread and return them"""
+    timings, local.timings = getattr(local, 'timings', None), None
+    return timings
+
+
+def format_timings(timings):
+    """Format trace timings for the X-Render-Timing header (Server-Timing syntax, ms)"""
+    return ', '.join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format"""
+    with metrics_lock:
+        counter_items = sorted(counters.items())
+        histogram_items = sorted((key, {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']})
+                                 for key, h in histograms.items())
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == 'counter':
+            for (metric, labels), value in counter_items:
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+            continue
+
+        for (metric, labels), histogram in histogram_items:
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS, histogram['buckets']):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,1522 @@
+"""Help menu image renderer
+
+The rendering core used by the web app and the command line tool. It does not
+import Flask, so it can be used headless: load a config with load_config_file,
+render it with generate_help_image and encode it with encode_image.
+"""
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+import yaml
+import os
+import io
+import re
+import sys
+import math
+import threading
+import time
+import hashlib
+import json
+from collections import OrderedDict
+from functools import lru_cache
+
+import metrics
+
+# Render settings; the web app overrides FONT_FOLDER with its own configuration
+settings = {
+    'FONT_FOLDER': 'fonts',
+    # Font cache: maximum number of loaded font instances (LRU)
+    'FONT_CACHE_SIZE': 64,
+    # Layer cache: rendered background/header/section/card layers
+    'LAYER_CACHE_BYTES': 128 * 1024 * 1024,  # 128MB
+    # Asset cache: decoded and resized avatar/logo/background images
+    'ASSET_CACHE_BYTES': 64 * 1024 * 1024,  # 64MB
+    # Parallel rendering: number of worker processes for sections (0 or 1 = sequential)
+    'RENDER_WORKERS': 0,
+    # Fall back to system fonts; when False only uploaded fonts and Pillow's
+    # bundled font are used, which makes renders reproducible across machines
+    'SYSTEM_FONTS': True,
+}
+
+# Use the C-accelerated YAML loader when libyaml is available
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Upload store object names: <sha256><extension>
+OBJECT_NAME_RE = re.compile(r'^([0-9a-f]{64})(\.[^.]*)?$')
+
+# Version of the rendered output. Bump it with any change that alters the pixels
+# (layout, gradients, text layout, ...) so cached renders and ETags expire
+RENDER_VERSION = 4
+
+
+# Font cache: resolved font paths and loaded font instances (LRU)
+font_path_cache = {}
+font_cache = OrderedDict()
+font_cache_lock = threading.Lock()
+
+EMOJI_FONT_PATHS = [
+    # Windows
+    'C:\\Windows\\Fonts\\seguiemj.ttf',  # Segoe UI Emoji
+    'C:\\Windows\\Fonts\\NotoColorEmoji.ttf',
+    # Linux
+    '/usr/share/fonts/truetype/noto/NotoColorEmoji.ttf',
+    # macOS
+    '/System/Library/Fonts/Apple Color Emoji.ttc',
+]
+
+SYSTEM_FONT_PATHS = [
+    # Windows - Chinese fonts work better
+    'C:\\Windows\\Fonts\\msyh.ttc',  # Microsoft YaHei (supports Chinese and some emoji)
+    'C:\\Windows\\Fonts\\simhei.ttf',  # SimHei
+    'C:\\Windows\\Fonts\\simsun.ttc',  # SimSun
+    'C:\\Windows\\Fonts\\arial.ttf',
+    # Linux
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    # macOS
+    '/System/Library/Fonts/PingFang.ttc',
+    '/System/Library/Fonts/Helvetica.ttc',
+]
+
+# Output image formats for /api/generate
+IMAGE_FORMATS = {
+    'png': {'pillow_format': 'PNG', 'mimetype': 'image/png', 'extension': 'png'},
+    'webp': {'pillow_format': 'WEBP', 'mimetype': 'image/webp', 'extension': 'webp'},
+    'jpeg': {'pillow_format': 'JPEG', 'mimetype': 'image/jpeg', 'extension': 'jpg'},
+}
+
+# Default encoder settings, overridden by the config's `output` section and per request
+OUTPUT_DEFAULTS = {
+    'format': 'png',
+    'compress_level': 6,  # PNG zlib level 0-9
+    'optimize': False,  # PNG/JPEG extra optimization pass (slower)
+    'colors': 0,  # PNG adaptive palette size (2-256), 0 keeps full RGB
+    'quality': 90,  # WebP (lossy) / JPEG quality 1-100
+    'lossless': True,  # WebP lossless
+    'method': 4,  # WebP effort 0-6
+}
+
+# Built-in color themes
+PRESET_THEMES = {
+    'default': {
+        'name': 'Sweet Cherry',
+        'background_gradient': ['#ffe5ec', '#ffd6e0'],
+        'angle': 135,
+        'card_background': '#ffffff',
+        'card_border': '#f0cfd4',
+        'title_color': '#c2185b',
+        'subtitle_color': '#d81b60',
+    },
+    'dark_mode': {
+        'name': 'Midnight Deep',
+        'background_gradient': ['#1a1a2e', '#16213e'],
+        'angle': 180,
+        'card_background': '#1e293b',
+        'card_border': '#0f172a',
+        'title_color': '#e2e8f0',
+        'subtitle_color': '#cbd5e1',
+    },
+    'purple_dream': {
+        'name': 'Purple Fantasy',
+        'background_gradient': ['#e0c3fc', '#8ec5fc'],
+        'angle': 120,
+        'card_background': '#ffffff',
+        'card_border': '#d4b5f5',
+        'title_color': '#512da8',
+        'subtitle_color': '#673ab7',
+    },
+    'green_fresh': {
+        'name': 'Forest Fresh',
+        'background_gradient': ['#c8e6c9', '#81c784'],
+        'angle': 90,
+        'card_background': '#f1f8e9',
+        'card_border': '#a5d6a7',
+        'title_color': '#1b5e20',
+        'subtitle_color': '#2e7d32',
+    },
+    'orange_vibrant': {
+        'name': 'Sunset Warmth',
+        'background_gradient': ['#ffe0b2', '#ffb74d'],
+        'angle': 45,
+        'card_background': '#ffffff',
+        'card_border': '#ffd699',
+        'title_color': '#e65100',
+        'subtitle_color': '#f57c00',
+    },
+    'sunset': {
+        'name': 'Evening Glow',
+        'background_gradient': ['#ff6b6b', '#ffa94d', '#ffd43b'],
+        'angle': 135,
+        'card_background': '#ffffff',
+        'card_border': '#ffc0d9',
+        'title_color': '#c62828',
+        'subtitle_color': '#e03131',
+    },
+    'ocean': {
+        'name': 'Ocean Azure',
+        'background_gradient': ['#0096ff', '#1fc0ff'],
+        'angle': 90,
+        'card_background': '#f0f8ff',
+        'card_border': '#81d4fa',
+        'title_color': '#00467f',
+        'subtitle_color': '#0277bd',
+    },
+    'cherry_blossom': {
+        'name': 'Cherry Bloom',
+        'background_gradient': ['#f8bbd0', '#ff80ab'],
+        'angle': 120,
+        'card_background': '#fff9e6',
+        'card_border': '#f8bbd0',
+        'title_color': '#880e4f',
+        'subtitle_color': '#ad1457',
+    },
+    'mint_fresh': {
+        'name': 'Mint Cool',
+        'background_gradient': ['#b2dfdb', '#80deea'],
+        'angle': 45,
+        'card_background': '#e0f2f1',
+        'card_border': '#80cbc4',
+        'title_color': '#00695c',
+        'subtitle_color': '#00796b',
+    },
+    'lavender_dream': {
+        'name': 'Lavender Dream',
+        'background_gradient': ['#e1bee7', '#ce93d8'],
+        'angle': 135,
+        'card_background': '#f3e5f5',
+        'card_border': '#e0bee7',
+        'title_color': '#6a1b9a',
+        'subtitle_color': '#7b1fa2',
+    },
+    'golden_hour': {
+        'name': 'Golden Hour',
+        'background_gradient': ['#fff9c4', '#ffeb3b'],
+        'angle': 90,
+        'card_background': '#fffde7',
+        'card_border': '#ffeb3b',
+        'title_color': '#b8860b',
+        'subtitle_color': '#cd853f',
+    },
+    'blush_pink': {
+        'name': 'Blush Pink',
+        'background_gradient': ['#ffccdd', '#ff99cc'],
+        'angle': 180,
+        'card_background': '#ffffff',
+        'card_border': '#ffb3d9',
+        'title_color': '#b2102f',
+        'subtitle_color': '#d32f2f',
+    },
+    'teal_elegance': {
+        'name': 'Teal Elegance',
+        'background_gradient': ['#b2dfdb', '#4db6ac'],
+        'angle': 120,
+        'card_background': '#e0f2f1',
+        'card_border': '#80cbc4',
+        'title_color': '#00251a',
+        'subtitle_color': '#004d40',
+    },
+    'coral_reef': {
+        'name': 'Coral Reef',
+        'background_gradient': ['#ffab91', '#ff7043'],
+        'angle': 45,
+        'card_background': '#ffe0d2',
+        'card_border': '#ffab91',
+        'title_color': '#5d2c0c',
+        'subtitle_color': '#8b4513',
+    },
+    'midnight_blue': {
+        'name': 'Midnight Sapphire',
+        'background_gradient': ['#1a237e', '#283593'],
+        'angle': 180,
+        'card_background': '#3f51b5',
+        'card_border': '#1a237e',
+        'title_color': '#e8eaf6',
+        'subtitle_color': '#c5cae9',
+    },
+    'spring_bud': {
+        'name': 'Spring Bud',
+        'background_gradient': ['#dcedc8', '#aed581'],
+        'angle': 90,
+        'card_background': '#f1f8e9',
+        'card_border': '#c5e1a5',
+        'title_color': '#33691e',
+        'subtitle_color': '#558b2f',
+    },
+}
+
+
+def hex_to_rgb(hex_color):
+    """Convert hex color to RGB tuple"""
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+
+def gradient_color_at(rgb_colors, ratio):
+    """Interpolate evenly spaced color stops at ratio (0.0 - 1.0)"""
+    ratio = min(max(ratio, 0.0), 1.0)
+    segment = ratio * (len(rgb_colors) - 1)
+    index = min(int(segment), len(rgb_colors) - 2)
+    local = segment - index
+
+    start, end = rgb_colors[index], rgb_colors[index + 1]
+    return tuple(int(start[i] + (end[i] - start[i]) * local) for i in range(3))
+
+
+def create_gradient_background(width, height, colors, angle=135):
+    """Create a gradient background
+
+    0 = left to right, 90 = top to bottom, 180 = right to left and
+    270 = bottom to top. Any other angle follows CSS
+    linear-gradient(<angle>deg), like the editor's preview: the gradient
+    runs along (sin(angle), -cos(angle)) with y pointing down, centred on
+    the canvas and long enough to reach the corners, so 135 runs from the
+    top-left to the bottom-right corner and 45 from the bottom-left to the
+    top-right. Any number of colors can be given; they are spread evenly
+    along the gradient.
+    """
+    colors = list(colors or ['#ffffff'])
+    if len(colors) < 2:
+        colors = colors + colors  # Duplicate if only one color
+
+    # Convert hex colors to RGB
+    rgb_colors = [hex_to_rgb(c) for c in colors]
+    angle = angle % 360
+
+    # Axis-aligned gradients: build a single row/column and stretch it
+    if angle in [0, 180]:  # Horizontal
+        strip = Image.new('RGB', (width, 1))
+        for x in range(width):
+            ratio = x / width
+            if angle == 180:
+                ratio = 1 - ratio
+            strip.putpixel((x, 0), gradient_color_at(rgb_colors, ratio))
+        return strip.resize((width, height), Image.Resampling.NEAREST)
+
+    if angle in [90, 270]:  # Vertical
+        strip = Image.new('RGB', (1, height))
+        for y in range(height):
+            ratio = y / height
+            if angle == 270:
+                ratio = 1 - ratio
+            strip.putpixel((0, y), gradient_color_at(rgb_colors, ratio))
+        return strip.resize((width, height), Image.Resampling.NEAREST)
+
+    # Any other angle: project every pixel onto the gradient direction with a
+    # single affine transform that samples a pre-computed color strip
+    radians = math.radians(angle)
+    dir_x, dir_y = math.sin(radians), -math.cos(radians)
+    span = abs(width * dir_x) + abs(height * dir_y)  # Gradient length
+    steps = max(int(math.ceil(span)), 1)
+    pad = 1  # Edge pixels so sampling never leaves the strip
+
+    strip = Image.new('RGB', (steps + 1 + pad * 2, 1))
+    for i in range(steps + 1 + pad * 2):
+        strip.putpixel((i, 0), gradient_color_at(rgb_colors, (i - pad) / steps))
+
+    # strip_x = pad + steps / 2 + steps * ((x - w/2) * dir_x + (y - h/2) * dir_y) / span
+    scale = steps / span
+    offset = pad + steps / 2 - scale * (dir_x * width / 2 + dir_y * height / 2)
+    return strip.transform((width, height), Image.Transform.AFFINE,
+                           (scale * dir_x, scale * dir_y, offset, 0, 0, 0),
+                           resample=Image.Resampling.NEAREST)
+
+
+def resolve_font_path(font_name, emoji_support=False):
+    """Resolve the font file for a font name, memoizing filesystem probes
+
+    Returns None when no font file is found (the PIL default font is used).
+    """
+    key = (font_name, emoji_support)
+    with font_cache_lock:
+        if key in font_path_cache:
+            return font_path_cache[key]
+
+    font_path = None
+    if font_name and font_name != 'default':
+        # Uploaded fonts are aliases into the upload store
+        font_path = resolve_alias(settings['FONT_FOLDER'], font_name)
+        candidate = os.path.join(settings['FONT_FOLDER'], font_name)
+        if font_path is None and os.path.exists(candidate):
+            font_path = candidate
+
+    # If emoji support is needed, try emoji fonts first
+    if font_path is None and emoji_support and settings['SYSTEM_FONTS']:
+        font_path = next((path for path in EMOJI_FONT_PATHS if os.path.exists(path)), None)
+
+    # Try common system font paths (for Chinese characters)
+    if font_path is None and settings['SYSTEM_FONTS']:
+        font_path = next((path for path in SYSTEM_FONT_PATHS if os.path.exists(path)), None)
+
+    with font_cache_lock:
+        font_path_cache[key] = font_path
+    return font_path
+
+
+def load_font(font_path, size):
+    """Load a font file, fallback to default if it cannot be loaded"""
+    try:
+        if font_path:
+            return ImageFont.truetype(font_path, size)
+        # If all fails, use default PIL font (scalable when FreeType is available)
+        return ImageFont.load_default(size)
+    except Exception as e:
+        print(f"Error loading font: {e}")
+        # If all fails, use default PIL font
+        return ImageFont.load_default()
+
+
+def get_font(font_name, size, emoji_support=False):
+    """Get font object, fallback to default if not found
+
+    Loaded fonts are kept in a process-wide LRU cache keyed by
+    (font name, size, emoji flag).
+    """
+    key = (font_name, size, emoji_support)
+    with font_cache_lock:
+        font = font_cache.get(key)
+        if font is not None:
+            font_cache.move_to_end(key)
+    metrics.count_cache('font', font is not None)
+    if font is not None:
+        return font
+
+    font = load_font(resolve_font_path(font_name, emoji_support), size)
+
+    with font_cache_lock:
+        font_cache[key] = font
+        font_cache.move_to_end(key)
+        while len(font_cache) > settings['FONT_CACHE_SIZE']:
+            font_cache.popitem(last=False)
+    return font
+
+
+def invalidate_font_cache(font_name=None):
+    """Drop cached font paths and instances (all of them, or one font name)"""
+    with font_cache_lock:
+        if font_name is None:
+            font_path_cache.clear()
+            font_cache.clear()
+            return
+
+        for key in [k for k in font_path_cache if k[0] == font_name]:
+            del font_path_cache[key]
+        for key in [k for k in font_cache if k[0] == font_name]:
+            del font_cache[key]
+
+
+def clean_markdown(text):
+    """Simple markdown cleanup for image rendering - now preserves formatting markers"""
+    if not text:
+        return ''
+    # Remove only link markdown, keep bold/italic markers for rendering
+    text = MARKDOWN_LINK_RE.sub(r'\1', text)  # [link](url) -> text
+    return text
+
+
+# Text layout engine: markdown runs are parsed once, measurements, line
+# layouts and bold glyph masks are cached per (text, font).
+MARKDOWN_LINK_RE = re.compile(r'\[(.+?)\]\(.+?\)')
+MARKDOWN_BOLD_RE = re.compile(r'(\*\*.*?\*\*|__.*?__)')
+# Latin words stay together; CJK and other characters can break anywhere
+WRAP_TOKEN_RE = re.compile(r'\s+|[^\s\u2e80-\u9fff\uf900-\ufaff\uff00-\uffef]+|.')
+ELLIPSIS = '…'
+TEXT_MASK_PADDING = 2
+
+# Corner badge placement (bot_info.corner_badge_position) and padding
+CORNER_POSITIONS = ('top-left', 'top-right', 'bottom-left', 'bottom-right')
+BADGE_PADDING_X = 12
+BADGE_PADDING_Y = 6
+
+
+def scale_px(value, scale):
+    """Convert a length in logical units (the 1x pixels of the config) to whole pixels at scale"""
+    return int(round(value * scale))
+
+
+@lru_cache(maxsize=4096)
+def parse_markdown_runs(text):
+    """Split text into (segment, is_bold) runs on **bold** / __bold__ markers"""
+    runs = []
+    for part in MARKDOWN_BOLD_RE.split(text):
+        if not part:
+            continue
+        is_bold = part.startswith('**') and part.endswith('**') or part.startswith('__') and part.endswith('__')
+        runs.append((part[2:-2], True) if is_bold else (part, False))
+    return tuple(runs)
+
+
+@lru_cache(maxsize=16384)
+def measure_text(font, text):
+    """Advance width of text in font"""
+    try:
+        return font.getlength(text)
+    except Exception:
+        # Fallback if the font cannot measure
+        return len(text) * 10
+
+
+@lru_cache(maxsize=256)
+def font_line_height(font, scale=1):
+    """Line height (glyph height + 5 units of spacing) of a font"""
+    try:
+        # Try to get font size from bbox
+        bbox = font.getbbox('Ay')
+        return bbox[3] - bbox[1] + scale_px(5, scale)  # Add 5px spacing
+    except Exception:
+        # Fallback to estimated height
+        return scale_px(20, scale)
+
+
+@lru_cache(maxsize=256)
+def font_mask_height(font):
+    """Height that fits any glyph of a font when drawn at y = 0"""
+    try:
+        ascent, descent = font.getmetrics()
+        return ascent + descent
+    except Exception:
+        return font.getbbox('Ay')[3]
+
+
+@lru_cache(maxsize=2048)
+def bold_text_mask(font, text, weight=1):
+    """Coverage mask of bold text, rasterized once and cached
+
+    Bold is the glyph mask screen-blended with copies shifted by up to
+    weight pixels right and down (weight 1: the same coverage the old
+    four-pass drawing produced), for the cost of a single rasterization.
+    The mask origin sits at (-TEXT_MASK_PADDING, -TEXT_MASK_PADDING)
+    relative to the text position.
+    """
+    pad = TEXT_MASK_PADDING
+    size = (int(math.ceil(measure_text(font, text))) + pad * 2 + weight,
+            font_mask_height(font) + pad * 2 + weight)
+    mask = Image.new('L', size, 0)
+    ImageDraw.Draw(mask).text((pad, pad), text, fill=255, font=font)
+
+    bold_mask = mask
+    offsets = [(dx, dy) for dy in range(weight + 1) for dx in range(weight + 1) if dx or dy]
+    for offset in offsets:
+        shifted = Image.new('L', size, 0)
+        shifted.paste(mask, offset)
+        bold_mask = ImageChops.screen(bold_mask, shifted)
+    return bold_mask
+
+
+def truncate_line(runs, font, max_width):
+    """Cut a line of runs so that it fits max_width with a trailing ellipsis"""
+    limit = max_width - measure_text(font, ELLIPSIS)
+    result, width = [], 0
+    for segment, bold in runs:
+        for char in segment:
+            char_width = measure_text(font, char)
+            if width + char_width > limit:
+                break
+            result.append((char, bold))
+            width += char_width
+        else:
+            continue
+        break
+    if result:
+        result.append((ELLIPSIS, result[-1][1]))
+    else:
+        result.append((ELLIPSIS, runs[0][1] if runs else False))
+    return result
+
+
+@lru_cache(maxsize=4096)
+def layout_text(text, font, max_width=None, max_lines=None, markdown=True):
+    """Lay text out into lines of positioned runs
+
+    Returns a tuple of lines, each a tuple of (x offset, segment, is_bold)
+    with adjacent segments of the same style merged. Newlines always break;
+    with max_width, lines are word-wrapped (CJK text breaks between any
+    characters). With max_lines, the last line is ellipsized.
+    """
+    if markdown:
+        runs = parse_markdown_runs(text)
+    else:
+        runs = ((text, False),)
+
+    # Word-wrap into lines of (token, bold)
+    lines = [[]]
+    widths = [0]
+    for segment, bold in runs:
+        for part_index, part in enumerate(segment.split('\n')):
+            if part_index:
+                lines.append([])
+                widths.append(0)
+            for token in WRAP_TOKEN_RE.findall(part):
+                token_width = measure_text(font, token)
+                if max_width and widths[-1] + token_width > max_width and lines[-1]:
+                    if token.isspace():
+                        continue
+                    lines.append([])
+                    widths.append(0)
+                if max_width and token_width > max_width:
+                    # A single word wider than the line: break it by character
+                    for char in token:
+                        char_width = measure_text(font, char)
+                        if widths[-1] + char_width > max_width and lines[-1]:
+                            lines.append([])
+                            widths.append(0)
+                        lines[-1].append((char, bold))
+                        widths[-1] += char_width
+                    continue
+                lines[-1].append((token, bold))
+                widths[-1] += token_width
+
+    if max_lines and len(lines) > max_lines:
+        lines = lines[:max_lines]
+        suffix_width = measure_text(font, ' ' + ELLIPSIS)
+        if not max_width or widths[max_lines - 1] + suffix_width <= max_width:
+            lines[-1] = lines[-1] + [(' ', False), (ELLIPSIS, False)]
+        else:
+            lines[-1] = truncate_line(lines[-1], font, max_width)
+    elif max_width and lines and widths[len(lines) - 1] > max_width:
+        lines[-1] = truncate_line(lines[-1], font, max_width)
+
+    # Merge adjacent tokens of the same style and position them
+    laid_out = []
+    for line in lines:
+        merged = []
+        for token, bold in line:
+            if merged and merged[-1][1] == bold:
+                merged[-1][0] += token
+            else:
+                merged.append([token, bold])
+        x = 0
+        positioned = []
+        for segment, bold in merged:
+            positioned.append((int(round(x)), segment, bold))
+            x += measure_text(font, segment)
+        laid_out.append(tuple(positioned))
+    return tuple(laid_out)
+
+
+def draw_text_layout(draw, position, lines, font, color, bold=False, scale=1):
+    """Draw lines produced by layout_text; bold runs are drawn from a cached mask
+
+    scale sets the line spacing and bold weight of text drawn at a render scale.
+    """
+    x, y = position
+    line_height = font_line_height(font, scale)
+    weight = max(1, scale_px(1, scale))
+    for i, line in enumerate(lines):
+        line_y = y + (i * line_height)
+        for offset, segment, segment_bold in line:
+            if not segment or segment.isspace():
+                continue
+            if bold or segment_bold:
+                mask = bold_text_mask(font, segment, weight)
+                draw.bitmap((int(x + offset) - TEXT_MASK_PADDING, int(line_y) - TEXT_MASK_PADDING), mask, fill=color)
+            else:
+                draw.text((x + offset, line_y), segment, fill=color, font=font)
+
+
+def draw_text_with_style(draw, position, text, font, color, bold=False, italic=False, max_width=None, max_lines=None,
+                         scale=1):
+    """Draw text with bold/italic style support and multi-line support
+
+    Returns the number of lines drawn.
+    """
+    if not text:
+        return 0
+
+    # Note: Italic is not supported in PIL/Pillow without complex transformations
+    # Users should use italic font files if needed
+    lines = layout_text(text, font, max_width, max_lines, markdown=False)
+    draw_text_layout(draw, position, lines, font, color, bold, scale)
+    return len(lines)
+
+
+def draw_text_with_markdown(draw, position, text, font, color, bold=False, italic=False, max_width=None, max_lines=None,
+                            scale=1):
+    """Draw text with basic markdown support (bold) and optional style
+
+    Returns the number of lines drawn.
+    """
+    if not text:
+        return 0
+
+    lines = layout_text(text, font, max_width, max_lines, markdown=True)
+    draw_text_layout(draw, position, lines, font, color, bold, scale)
+    return len(lines)
+
+
+def draw_rounded_rectangle(draw, xy, radius, fill, outline=None, width=1):
+    """Draw a rounded rectangle"""
+    x1, y1, x2, y2 = xy
+
+    # Draw rounded corners
+    draw.ellipse([x1, y1, x1 + radius * 2, y1 + radius * 2], fill=fill, outline=outline, width=width)
+    draw.ellipse([x2 - radius * 2, y1, x2, y1 + radius * 2], fill=fill, outline=outline, width=width)
+    draw.ellipse([x1, y2 - radius * 2, x1 + radius * 2, y2], fill=fill, outline=outline, width=width)
+    draw.ellipse([x2 - radius * 2, y2 - radius * 2, x2, y2], fill=fill, outline=outline, width=width)
+
+    # Draw rectangles to fill the gaps
+    draw.rectangle([x1 + radius, y1, x2 - radius, y2], fill=fill, outline=outline, width=width)
+    draw.rectangle([x1, y1 + radius, x2, y2 - radius], fill=fill, outline=outline, width=width)
+
+
+class ImageCache:
+    """Memory-bounded LRU cache of Pillow images; name labels its hit/miss metrics"""
+
+    def __init__(self, max_bytes, name='image'):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.lock = threading.Lock()
+        self.images = OrderedDict()
+        self.total_bytes = 0
+
+    @staticmethod
+    def image_bytes(image):
+        return image.width * image.height * len(image.getbands())
+
+    def get(self, key):
+        """Return the cached image or None"""
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+        metrics.count_cache(self.name, image is not None)
+        return image
+
+    def put(self, key, image):
+        """Store an image, evicting least recently used ones over budget"""
+        size = self.image_bytes(image)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.images.pop(key, None)
+            if old is not None:
+                self.total_bytes -= self.image_bytes(old)
+            self.images[key] = image
+            self.total_bytes += size
+            while self.images and self.total_bytes > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.total_bytes -= self.image_bytes(evicted)
+
+    def discard(self, match):
+        """Drop every cached image whose key satisfies match(key)"""
+        with self.lock:
+            for key in [key for key in self.images if match(key)]:
+                self.total_bytes -= self.image_bytes(self.images.pop(key))
+
+    def clear(self):
+        """Drop every cached image"""
+        with self.lock:
+            self.images.clear()
+            self.total_bytes = 0
+
+
+# Rendered layers (background, header, section titles, cards)
+layer_cache = ImageCache(settings['LAYER_CACHE_BYTES'], 'layer')
+
+# Decoded, resized (and masked) avatar/logo/background images
+asset_cache = ImageCache(settings['ASSET_CACHE_BYTES'], 'asset')
+
+
+@lru_cache(maxsize=16)
+def circle_mask(size):
+    """Circular 'L' mask of size x size"""
+    mask = Image.new('L', (size, size), 0)
+    mask_draw = ImageDraw.Draw(mask)
+    mask_draw.ellipse([0, 0, size, size], fill=255)
+    return mask
+
+
+def load_asset(path, kind, size):
+    """Load an image asset decoded and resized for drawing, through the asset cache
+
+    kind is 'avatar' (RGBA, size x size, circular mask), 'logo' (RGBA
+    thumbnail fitting in size x size) or 'background' (RGB, exactly size).
+    Entries are keyed by the file fingerprint (size and mtime, or the
+    digest of an upload store object) plus the target size, so a changed
+    file is decoded again. Raises if the file cannot be
+    read. Cached images are shared and must not be modified.
+    """
+    fingerprint = file_fingerprint(path)
+    key = (kind, os.path.normpath(path), tuple(fingerprint[1:]), size)
+    image = asset_cache.get(key)
+    if image is not None:
+        return image
+
+    with Image.open(path) as source:
+        if kind == 'avatar':
+            image = source.resize((size, size)).convert('RGB')
+            image.putalpha(circle_mask(size))
+        elif kind == 'logo':
+            image = source.convert('RGBA')
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        else:
+            # Let JPEG decode at a reduced scale when the photo is much larger
+            source.draft('RGB', size)
+            image = source.convert('RGB').resize(size)
+
+    asset_cache.put(key, image)
+    return image
+
+
+def invalidate_asset_cache(path=None):
+    """Drop decoded assets (all of them, or every size of one file)"""
+    if path is None:
+        asset_cache.clear()
+    else:
+        path = os.path.normpath(path)
+        asset_cache.discard(lambda key: key[1] == path)
+
+
+def clear_render_caches():
+    """Drop every in-process render cache so the next render starts cold"""
+    invalidate_font_cache()
+    layer_cache.clear()
+    asset_cache.clear()
+    for cached in (parse_markdown_runs, measure_text, font_line_height, font_mask_height,
+                   bold_text_mask, layout_text, circle_mask):
+        cached.cache_clear()
+
+
+def layer_key(*parts):
+    """Hash the inputs of a layer into a cache key"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+# Layout: fixed header and section title heights
+HEADER_HEIGHT = 200
+SECTION_TITLE_HEIGHT = 60
+# Largest layout.scale accepted (a 4x render has 16x the pixels)
+MAX_SCALE = 4
+
+
+def layout_scale(config):
+    """Render scale of a config: layout.scale, 1 by default"""
+    return (config.get('layout') or {}).get('scale') or 1
+
+
+def compute_layout(config):
+    """Compute the canvas size and the position of every layer
+
+    Everything is in logical units, the pixels of a 1x render, whatever
+    layout.scale is; scale_layout maps the result to pixels at any scale.
+
+    By default every section is as tall as the one with the most items. With
+    layout.fit_sections each section is sized to its own rows, and with
+    layout.show_header false the header is left out (header_box is None);
+    paginate_config uses both for pages after the first.
+    """
+    layout = config.get('layout', {})
+    sections = config.get('sections', [])
+
+    # Image dimensions
+    items_per_row = layout.get('items_per_row', 3)
+    card_width = layout.get('card_width', 200)
+    card_height = layout.get('card_height', 80)
+    padding = layout.get('padding', 20)
+    spacing = layout.get('spacing', 15)
+
+    # Calculate image size
+    max_items = max([len(section.get('items', [])) for section in sections] + [0])
+    rows_per_section = (max_items + items_per_row - 1) // items_per_row
+
+    show_header = layout.get('show_header', True)
+    header_height = HEADER_HEIGHT if show_header else padding
+    section_title_height = SECTION_TITLE_HEIGHT
+
+    total_width = padding * 2 + (card_width + spacing) * items_per_row - spacing
+    section_height = section_title_height + (card_height + spacing) * rows_per_section + spacing
+    total_height = header_height + len(sections) * section_height + padding * 2
+
+    section_boxes = []
+    y_offset = header_height
+    for section in sections:
+        items = section.get('items', [])
+        title_box = (0, y_offset, total_width, y_offset + section_title_height)
+        y_offset += section_title_height
+
+        cards = []
+        for idx in range(len(items)):
+            row = idx // items_per_row
+            col = idx % items_per_row
+            cards.append((padding + col * (card_width + spacing), y_offset + row * (card_height + spacing)))
+
+        y_offset += (card_height + spacing) * ((len(items) + items_per_row - 1) // items_per_row) + spacing
+        section_boxes.append({'box': (0, title_box[1], total_width, y_offset), 'title_box': title_box, 'cards': cards})
+
+    if layout.get('fit_sections', False):
+        total_height = y_offset + padding * 2
+
+    return {
+        'width': total_width,
+        'height': total_height,
+        'padding': padding,
+        'card_width': card_width,
+        'card_height': card_height,
+        'header_box': (0, 0, total_width, header_height) if show_header else None,
+        'sections': section_boxes,
+        'scale': 1,
+    }
+
+
+def scale_layout(layout, scale):
+    """Map a logical layout from compute_layout to pixels at scale
+
+    Every coordinate is rounded on its own, so boxes that touch in logical
+    units still touch at fractional scales.
+    """
+    scale_box = lambda box: tuple(scale_px(value, scale) for value in box)
+    return {
+        'width': scale_px(layout['width'], scale),
+        'height': scale_px(layout['height'], scale),
+        'padding': scale_px(layout['padding'], scale),
+        'card_width': scale_px(layout['card_width'], scale),
+        'card_height': scale_px(layout['card_height'], scale),
+        'header_box': scale_box(layout['header_box']) if layout['header_box'] else None,
+        'sections': [{'box': scale_box(boxes['box']), 'title_box': scale_box(boxes['title_box']),
+                      'cards': [scale_box(card) for card in boxes['cards']]} for boxes in layout['sections']],
+        'scale': scale,
+    }
+
+
+def paginate_config(config, page_height, scale=None):
+    """Split a config into page configs, each at most page_height pixels tall
+
+    page_height is in pixels of the render at scale (layout.scale by
+    default), so at scale 2 a page holds half as many logical units. The
+    first page keeps the header. Sections are sized to their own rows
+    and split between rows when they do not fit; the remainder continues on
+    the next page under the same title. A page always gets at least one row,
+    so a page_height smaller than one row still terminates. Each page is a
+    regular config and can be rendered (and cached) on its own.
+    """
+    layout = config.get('layout', {})
+    items_per_row = layout.get('items_per_row', 3)
+    card_height = layout.get('card_height', 80)
+    padding = layout.get('padding', 20)
+    spacing = layout.get('spacing', 15)
+    row_height = card_height + spacing
+    page_height = page_height / (scale or layout_scale(config))  # Pixels to logical units
+
+    pages = [[]]
+    used = HEADER_HEIGHT + padding * 2
+    for section in config.get('sections', []):
+        items = section.get('items', [])
+        rows = (len(items) + items_per_row - 1) // items_per_row
+        row = 0
+        while True:
+            fit = int((page_height - used - SECTION_TITLE_HEIGHT - spacing) // row_height)
+            if pages[-1] and (fit < 0 or (fit < 1 and row < rows)):
+                pages.append([])
+                used = padding * 3
+                continue
+
+            take = min(max(fit, 1), rows - row)
+            pages[-1].append(dict(section, items=items[row * items_per_row:(row + take) * items_per_row]))
+            used += SECTION_TITLE_HEIGHT + take * row_height + spacing
+            row += take
+            if row >= rows:
+                break
+            pages.append([])
+            used = padding * 3
+
+    return [dict(config, layout=dict(layout, fit_sections=True, show_header=index == 0), sections=sections)
+            for index, sections in enumerate(pages)]
+
+
+def load_render_style(config, scale=1):
+    """Load the fonts and colors shared by every layer of a render
+
+    Font sizes are logical; fonts are loaded at their pixel size for scale.
+    """
+    theme = config.get('theme', {})
+    fonts_config = config.get('fonts', {})
+
+    # Load fonts
+    title_font = get_font(fonts_config.get('title_font'), scale_px(fonts_config.get('title_size', 32), scale))
+    subtitle_font = get_font(fonts_config.get('content_font'), scale_px(fonts_config.get('subtitle_size', 18), scale))
+    card_title_font = get_font(fonts_config.get('content_font'), scale_px(fonts_config.get('card_title_size', 16), scale))
+    card_desc_font = get_font(fonts_config.get('content_font'), scale_px(fonts_config.get('card_desc_size', 12), scale))
+    # Load emoji font for icons
+    emoji_font = get_font(None, scale_px(fonts_config.get('card_title_size', 16), scale), emoji_support=True)
+    # Use smaller font for usage (0.85x of desc font)
+    try:
+        usage_font_size = max(8, int(fonts_config.get('card_desc_size', 12) * 0.85))
+        usage_font = get_font(fonts_config.get('content_font', None), scale_px(usage_font_size, scale))
+    except:
+        usage_font = card_desc_font
+
+    # Fonts are part of the key so replacing a font file re-renders its layers
+    font_files = [file_fingerprint(resolve_font_path(name)) for name in
+                  (fonts_config.get('title_font'), fonts_config.get('content_font'))]
+    font_files.append(file_fingerprint(resolve_font_path(None, emoji_support=True)))
+
+    return {
+        'key': layer_key('style', theme, fonts_config, font_files, scale),
+        'scale': scale,
+        'theme': theme,
+        'fonts_config': fonts_config,
+        'title_font': title_font,
+        'subtitle_font': subtitle_font,
+        'card_title_font': card_title_font,
+        'card_desc_font': card_desc_font,
+        'emoji_font': emoji_font,
+        'usage_font': usage_font,
+        'content_bold': fonts_config.get('content_bold', False),
+    }
+
+
+def render_background(config, width, height):
+    """Render (or fetch from the layer cache) the full-canvas background"""
+    theme = config.get('theme', {})
+    background_type = theme.get('background_type')
+    bg_path = theme.get('background_image') if background_type == 'image' else None
+
+    key = layer_key('background', width, height, background_type, theme.get('background_color'),
+                    theme.get('background_gradient'), theme.get('angle'), file_fingerprint(bg_path))
+    image = layer_cache.get(key)
+    if image is not None:
+        return image
+
+    # Create base image
+    if background_type == 'gradient':
+        gradient_colors = theme.get('background_gradient', ['#ffeef8', '#e6f3ff'])
+        angle = theme.get('angle', 135)
+        image = create_gradient_background(width, height, gradient_colors, angle)
+    elif background_type == 'image' and bg_path:
+        try:
+            image = load_asset(bg_path, 'background', (width, height))
+        except:
+            image = Image.new('RGB', (width, height), hex_to_rgb(theme.get('background_color', '#f5f5f5')))
+    else:
+        image = Image.new('RGB', (width, height), hex_to_rgb(theme.get('background_color', '#f5f5f5')))
+
+    layer_cache.put(key, image)
+    return image
+
+
+def render_layer(key, size, draw_layer):
+    """Render a transparent RGBA layer with draw_layer(tile), reusing cached layers"""
+    tile = layer_cache.get(key)
+    if tile is None:
+        tile = Image.new('RGBA', size, (0, 0, 0, 0))
+        draw_layer(tile)
+        layer_cache.put(key, tile)
+    return tile
+
+
+def draw_header(tile, bot_info, style, padding):
+    """Draw avatar, logo and bot info onto the header layer"""
+    theme = style['theme']
+    scale = style['scale']
+    draw = ImageDraw.Draw(tile)
+    y_offset = padding
+
+    # Draw avatar if exists
+    avatar_path = bot_info.get('avatar', '')
+    if avatar_path and os.path.exists(avatar_path):
+        try:
+            avatar = load_asset(avatar_path, 'avatar', scale_px(80, scale))
+            tile.alpha_composite(avatar, (padding, y_offset))
+        except Exception as e:
+            print(f"Error loading avatar: {e}")
+
+    # Draw logo if exists (in top-right corner)
+    logo_path = bot_info.get('logo', '')
+    if logo_path and os.path.exists(logo_path):
+        try:
+            # Size maintaining aspect ratio (max 80x80), in the top-right corner
+            logo_img = load_asset(logo_path, 'logo', scale_px(80, scale))
+            paste_layer(tile, logo_img, corner_position(tile.size, logo_img.size, 'top-right', padding))
+        except Exception as e:
+            print(f"Error loading logo: {e}")
+
+    # Draw bot info
+    text_x = padding + scale_px(100, scale)
+    bot_name = clean_markdown(bot_info.get('name', 'Bot'))
+    draw_text_with_style(draw, (text_x, y_offset), bot_name, style['title_font'], hex_to_rgb(theme.get('title_color', '#333333')),
+                        bold=style['fonts_config'].get('title_bold', False), scale=scale)
+
+    y_offset += scale_px(40, scale)
+    bot_qq = bot_info.get('qq', '')
+    if bot_qq:
+        draw_text_with_style(draw, (text_x, y_offset), f"QQ: {bot_qq}", style['subtitle_font'], hex_to_rgb(theme.get('subtitle_color', '#666666')),
+                            bold=style['content_bold'], scale=scale)
+
+    # Description and notice wrap to the header width and stay inside the header
+    text_width = tile.width - text_x - padding
+    desc_font = style['card_desc_font']
+    line_height = font_line_height(desc_font, scale)
+    notice = bot_info.get('notice', '')
+
+    y_offset += scale_px(30, scale)
+    description = bot_info.get('description', '')
+    if description:
+        notice_height = line_height if notice else 0
+        max_lines = max(1, (tile.height - padding - notice_height - y_offset) // line_height)
+        lines = draw_text_with_style(draw, (text_x, y_offset), description, desc_font, hex_to_rgb(theme.get('subtitle_color', '#666666')),
+                                     bold=style['content_bold'], max_width=text_width, max_lines=max_lines, scale=scale)
+        y_offset += max(scale_px(25, scale), lines * line_height)
+    else:
+        y_offset += scale_px(25, scale)
+
+    if notice:
+        max_lines = max(1, (tile.height - padding - y_offset) // line_height)
+        draw_text_with_style(draw, (text_x, y_offset), notice, desc_font, hex_to_rgb(theme.get('subtitle_color', '#666666')),
+                            bold=style['content_bold'], max_width=text_width, max_lines=max_lines, scale=scale)
+
+
+def draw_section_title(tile, section, style, padding):
+    """Draw a section title onto its layer"""
+    draw = ImageDraw.Draw(tile)
+    section_name = clean_markdown(section.get('name', ''))
+    draw_text_with_style(draw, (padding, 0), section_name, style['subtitle_font'], hex_to_rgb(style['theme'].get('title_color', '#333333')),
+                        bold=style['content_bold'], scale=style['scale'])
+
+
+def draw_card(tile, item, style):
+    """Draw a single command card onto its layer"""
+    theme = style['theme']
+    scale = style['scale']
+    draw = ImageDraw.Draw(tile)
+    card_width, card_height = tile.width - 1, tile.height - 1
+    x, y = 0, 0
+
+    # Draw card background
+    card_bg = hex_to_rgb(theme.get('card_background', '#ffffff'))
+    card_border = hex_to_rgb(theme.get('card_border', '#e0e0e0'))
+    draw_rounded_rectangle(draw, [x, y, x + card_width, y + card_height], scale_px(10, scale), fill=card_bg, outline=card_border,
+                           width=max(1, scale_px(2, scale)))
+
+    # Draw icon (if exists) - without background circle
+    icon_text = item.get('icon', '')
+    has_icon = bool(icon_text)
+
+    if has_icon:
+        # Icon should be vertically centered on the left side
+        icon_x = x + scale_px(15, scale)
+        icon_y = y + (card_height - scale_px(24, scale)) // 2  # Center the icon vertically
+        try:
+            draw.text((icon_x, icon_y), icon_text, font=style['emoji_font'],
+                     fill=hex_to_rgb(theme.get('card_title_color', '#444444')))
+        except Exception as e:
+            print(f"Icon rendering fallback: {e}")
+            draw.text((icon_x, icon_y), icon_text, font=style['card_desc_font'],
+                     fill=hex_to_rgb(theme.get('card_title_color', '#444444')))
+
+    # Text area: right of the icon, 10px inner margin on the right and bottom
+    text_x = x + scale_px(50 if has_icon else 15, scale)
+    text_width = card_width - text_x - scale_px(10, scale)
+    text_bottom = y + card_height - scale_px(6, scale)
+
+    # Draw item name - positioned to the right of icon
+    item_name = clean_markdown(item.get('name', ''))
+    name_y = y + scale_px(12, scale)
+    draw_text_with_markdown(draw, (text_x, name_y), item_name, style['card_title_font'], hex_to_rgb(theme.get('card_title_color', '#444444')),
+                           bold=style['content_bold'], max_width=text_width, max_lines=1, scale=scale)
+
+    # Draw description - aligned with name, wrapped to the card width and
+    # limited to the lines that fit above the usage line
+    item_desc = clean_markdown(item.get('description', ''))
+    item_usage = item.get('usage', '')
+    desc_y = y + scale_px(32, scale)
+    desc_line_height = font_line_height(style['card_desc_font'], scale)
+    usage_height = font_line_height(style['usage_font'], scale) if item_usage else 0
+    desc_lines = max(1, (text_bottom - usage_height - desc_y) // desc_line_height)
+    desc_lines = draw_text_with_markdown(draw, (text_x, desc_y), item_desc, style['card_desc_font'], hex_to_rgb(theme.get('card_desc_color', '#888888')),
+                                         bold=style['content_bold'], max_width=text_width, max_lines=desc_lines, scale=scale)
+
+    # Draw usage if available
+    if item_usage:
+        usage_y = max(y + scale_px(51, scale), desc_y + desc_lines * desc_line_height)
+
+        # Draw with slightly lighter color
+        desc_color = hex_to_rgb(theme.get('card_desc_color', '#888888'))
+        usage_color = tuple(min(255, c + 25) for c in desc_color)
+        usage_text = f"用法: {item_usage}"
+        draw_text_with_style(draw, (text_x, usage_y), usage_text, style['usage_font'], usage_color,
+                             max_width=text_width, max_lines=1, scale=scale)
+
+
+def paste_layer(image, layer, position):
+    """Composite a transparent layer onto an RGB canvas or another RGBA layer
+
+    Only the layer's region is blended and the target keeps its mode.
+    """
+    if image.mode == 'RGBA':
+        image.alpha_composite(layer, tuple(position))
+    else:
+        image.paste(layer, tuple(position), layer)
+
+
+def corner_position(canvas_size, size, position='top-right', margin=8):
+    """Top-left coordinate placing a box of size in a corner of the canvas
+
+    position is one of CORNER_POSITIONS; anything else means top-right.
+    """
+    if position not in CORNER_POSITIONS:
+        position = 'top-right'
+    vertical, horizontal = position.split('-')
+    x = margin if horizontal == 'left' else canvas_size[0] - margin - size[0]
+    y = margin if vertical == 'top' else canvas_size[1] - margin - size[1]
+    return (x, y)
+
+
+def draw_corner_badge(tile, text, font, style):
+    """Draw the corner badge (semi-transparent white with the badge text) onto its layer"""
+    tile.paste((255, 255, 255, 230), (0, 0, tile.width, tile.height))
+    draw = ImageDraw.Draw(tile)
+    subtitle_color = hex_to_rgb(style['theme'].get('subtitle_color', '#666666'))
+    scale = style['scale']
+    draw_text_with_markdown(draw, (scale_px(BADGE_PADDING_X, scale), scale_px(BADGE_PADDING_Y, scale)), text, font,
+                            subtitle_color, bold=style['content_bold'], scale=scale)
+
+
+def draw_section(image, section, boxes, layout, style, origin=(0, 0)):
+    """Paste a section's title and card layers onto image
+
+    origin is the top-left corner of image in canvas coordinates.
+    """
+    padding = layout['padding']
+    ox, oy = origin
+
+    title_box = boxes['title_box']
+    title_key = layer_key('section', style['key'], title_box[2] - title_box[0], padding, section.get('name', ''))
+    title = render_layer(title_key, (title_box[2] - title_box[0], title_box[3] - title_box[1]),
+                         lambda tile: draw_section_title(tile, section, style, padding))
+    paste_layer(image, title, (title_box[0] - ox, title_box[1] - oy))
+
+    # Draw items
+    card_size = (layout['card_width'] + 1, layout['card_height'] + 1)
+    for item, position in zip(section.get('items', []), boxes['cards']):
+        card_key = layer_key('card', style['key'], card_size, item)
+        card = render_layer(card_key, card_size, lambda tile: draw_card(tile, item, style))
+        paste_layer(image, card, (position[0] - ox, position[1] - oy))
+
+
+def init_render_worker(parent_settings, fonts_config, scale):
+    """Process pool initializer: take over the parent's settings and preload the render's fonts"""
+    settings.update(parent_settings)
+    load_render_style({'fonts': fonts_config}, scale)
+
+
+def render_section_worker(config, section, boxes, layout):
+    """Render one section (title and cards) into a transparent layer in a worker process"""
+    box = boxes['box']
+    style = load_render_style(config, layout['scale'])
+    section_layer = Image.new('RGBA', (box[2] - box[0], box[3] - box[1]), (0, 0, 0, 0))
+    draw_section(section_layer, section, boxes, layout, style, origin=box[:2])
+    return section_layer
+
+
+render_pool = None
+render_pool_key = None
+render_pool_lock = threading.Lock()
+
+
+def get_render_pool(workers, fonts_config, scale=1):
+    """Get the shared render process pool, (re)creating it for a new worker count or settings
+
+    Workers are spawned rather than forked, so they never inherit locks or
+    threads from a running server, and get a copy of settings instead. The
+    fonts of the render that starts the pool are preloaded at its scale;
+    other fonts and scales are loaded (and cached) by the workers on demand.
+    """
+    global render_pool, render_pool_key
+    pool_key = (workers, dict(settings))
+    with render_pool_lock:
+        if render_pool is None or render_pool_key != pool_key:
+            if render_pool is not None:
+                render_pool.shutdown(wait=False)
+            # Imported here: multiprocessing adds noticeably to the CLI's cold start
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            render_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                              initializer=init_render_worker,
+                                              initargs=(dict(settings), fonts_config, scale))
+            render_pool_key = pool_key
+        return render_pool
+
+
+def render_sections_parallel(config, layout, style, workers):
+    """Render every section as one layer, fanning uncached sections out to a process pool"""
+    # Workers only need the parts of the config that affect section layers
+    section_config = {'theme': style['theme'], 'fonts': style['fonts_config']}
+    card_size = (layout['card_width'], layout['card_height'])
+
+    section_layers = []
+    pending = {}
+    for index, (section, boxes) in enumerate(zip(config.get('sections', []), layout['sections'])):
+        key = layer_key('section-band', style['key'], boxes['box'], card_size, layout['padding'],
+                        [[x - boxes['box'][0], y - boxes['box'][1]] for x, y in boxes['cards']], section)
+        section_layer = layer_cache.get(key)
+        if section_layer is None:
+            pending[index] = key
+        section_layers.append(section_layer)
+
+    if pending:
+        pool = get_render_pool(workers, style['fonts_config'], layout['scale'])
+        futures = {index: pool.submit(render_section_worker, section_config,
+                                      config['sections'][index], layout['sections'][index], layout)
+                   for index in pending}
+        for index, future in futures.items():
+            section_layers[index] = future.result()
+            layer_cache.put(pending[index], section_layers[index])
+
+    return section_layers
+
+
+def generate_help_image(config, workers=None, scale=None):
+    """Generate help menu image based on configuration
+
+    The image is composed from independently cached layers: the background,
+    the header, one layer per section title and one per card. Editing a
+    single item only re-draws that item's card.
+
+    The layout is computed in logical units and drawn at scale (default:
+    layout.scale), so a 2x image is rendered directly at 2x, not upscaled.
+    With workers > 1 (default: RENDER_WORKERS) sections are rendered in
+    parallel on a process pool and composited afterwards.
+    """
+    with metrics.span('layout'):
+        layout = compute_layout(config)
+    return render_layout(config, layout, layout_scale(config) if scale is None else scale, workers)
+
+
+def generate_help_images(config, scales, workers=None):
+    """Render a config at several scales from a single layout pass
+
+    Returns {scale: image}. The renders share the font, asset and text
+    caches, so anything needed at the same pixel size is only loaded once.
+    """
+    with metrics.span('layout'):
+        layout = compute_layout(config)
+    return {scale: render_layout(config, layout, scale, workers) for scale in scales}
+
+
+def render_layout(config, layout, scale, workers=None):
+    """Draw a config onto its logical layout (from compute_layout) at scale"""
+    bot_info = config.get('bot_info', {})
+    sections = config.get('sections', [])
+    fonts_config = config.get('fonts', {})
+
+    layout = scale_layout(layout, scale)
+    total_width = layout['width']
+    padding = layout['padding']
+    with metrics.span('fonts'):
+        style = load_render_style(config, scale)
+
+    with metrics.span('background'):
+        image = render_background(config, total_width, layout['height']).copy()
+
+    # Draw header
+    header_box = layout['header_box']
+    if header_box:
+        with metrics.span('header'):
+            header_info = {k: v for k, v in bot_info.items() if k != 'corner_badge'}
+            header_key = layer_key('header', style['key'], header_box, padding, header_info,
+                                   file_fingerprint(bot_info.get('avatar')), file_fingerprint(bot_info.get('logo')))
+            header = render_layer(header_key, (header_box[2] - header_box[0], header_box[3] - header_box[1]),
+                                  lambda tile: draw_header(tile, bot_info, style, padding))
+            paste_layer(image, header, header_box[:2])
+
+    # Draw sections
+    if workers is None:
+        workers = settings['RENDER_WORKERS']
+    with metrics.span('sections'):
+        if workers > 1 and len(sections) > 1:
+            section_layers = render_sections_parallel(config, layout, style, workers)
+            for boxes, section_layer in zip(layout['sections'], section_layers):
+                paste_layer(image, section_layer, boxes['box'][:2])
+        else:
+            for section, boxes in zip(sections, layout['sections']):
+                draw_section(image, section, boxes, layout, style)
+
+    # Draw corner badge if exists
+    corner_badge = bot_info.get('corner_badge', '')
+    if corner_badge:
+        with metrics.span('corner_badge'):
+            # Use smaller font for corner badge
+            badge_font_size = scale_px(min(fonts_config.get('card_desc_size', 12), 11), scale)
+            badge_font = get_font(fonts_config.get('content_font', None), badge_font_size)
+
+            # Calculate badge dimensions
+            try:
+                bbox = badge_font.getbbox(corner_badge)
+                badge_text_width = bbox[2] - bbox[0]
+                badge_text_height = bbox[3] - bbox[1]
+            except:
+                badge_text_width = len(corner_badge) * badge_font_size * 0.6
+                badge_text_height = badge_font_size
+            badge_size = (int(badge_text_width + scale_px(BADGE_PADDING_X, scale) * 2),
+                          int(badge_text_height + scale_px(BADGE_PADDING_Y, scale) * 2))
+
+            # The badge is its own layer, blended into its corner only; the canvas stays RGB
+            badge_key = layer_key('corner-badge', style['key'], badge_size, corner_badge, badge_font_size)
+            badge = render_layer(badge_key, badge_size,
+                                 lambda tile: draw_corner_badge(tile, corner_badge, badge_font, style))
+            position = corner_position(image.size, badge_size, bot_info.get('corner_badge_position', 'top-right'),
+                                       scale_px(8, scale))
+            paste_layer(image, badge, position)
+
+    return image
+
+
+def downscale_image(image, scale):
+    """Shrink a render by scale (0 < scale <= 1) with cheap resampling
+
+    Whole-number factors (1/2, 1/3, ...) use Image.reduce, a box filter;
+    other scales use bilinear resampling.
+    """
+    if scale >= 1:
+        return image
+    factor = 1 / scale
+    with metrics.span('downscale'):
+        if abs(factor - round(factor)) < 1e-6:
+            return image.reduce(round(factor))
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.Resampling.BILINEAR)
+
+
+def object_digest(path):
+    """Return the SHA-256 digest encoded in an upload store object path, or None"""
+    if not path:
+        return None
+    directory, name = os.path.split(os.path.normpath(path))
+    match = OBJECT_NAME_RE.match(name)
+    if match and os.path.basename(directory) == 'objects':
+        return match.group(1)
+    return None
+
+
+def load_aliases(folder):
+    """Load the filename -> stored object index of an upload folder"""
+    try:
+        with open(os.path.join(folder, 'aliases.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def resolve_alias(folder, filename):
+    """Return the stored object path an uploaded filename points to, or None"""
+    alias = load_aliases(folder).get(filename)
+    if alias and os.path.exists(alias['path']):
+        return alias['path']
+    return None
+
+
+def file_fingerprint(path):
+    """Fingerprint a file by path, size and modification time
+
+    Upload store objects are immutable and named by their SHA-256, so they
+    are fingerprinted by that digest without touching the filesystem.
+    """
+    if not path:
+        return None
+    digest = object_digest(path)
+    if digest:
+        return [path, 'sha256', digest]
+    try:
+        stat = os.stat(path)
+        return [path, stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return [path, None, None]
+
+
+
+
+def load_config_file(path):
+    """Load a configuration from any YAML file, or from stdin for '-' (does not touch config.yaml)"""
+    if path == '-':
+        return yaml.load(sys.stdin, Loader=YamlLoader)
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=YamlLoader)
+
+
+def validate_config(config):
+    """Check the structure of a config, raising ValueError for the first problem found"""
+    if not isinstance(config, dict):
+        raise ValueError('Config must be a mapping')
+    for key in ('bot_info', 'layout', 'theme', 'fonts', 'output'):
+        if not isinstance(config.get(key) or {}, dict):
+            raise ValueError(f"'{key}' must be a mapping")
+
+    layout = config.get('layout') or {}
+    for key in ('items_per_row', 'card_width', 'card_height', 'padding', 'spacing', 'page_height'):
+        value = layout.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+            raise ValueError(f"layout.{key} must be a non-negative integer")
+    if layout.get('items_per_row') == 0:
+        raise ValueError('layout.items_per_row must be at least 1')
+    scale = layout.get('scale')
+    if scale is not None and (isinstance(scale, bool) or not isinstance(scale, (int, float))
+                              or not 0 < scale <= MAX_SCALE):
+        raise ValueError(f"layout.scale must be a number between 0 and {MAX_SCALE}")
+
+    sections = config.get('sections') or []
+    if not isinstance(sections, list):
+        raise ValueError("'sections' must be a list")
+    for number, section in enumerate(sections, 1):
+        if not isinstance(section, dict) or not isinstance(section.get('items') or [], list):
+            raise ValueError(f"Section {number} must be a mapping with a list of items")
+        if not all(isinstance(item, dict) for item in section.get('items') or []):
+            raise ValueError(f"Items of section {number} must be mappings")
+
+
+def resolve_output_options(config, overrides=None):
+    """Merge encoder defaults, the config's output section and per-request overrides"""
+    options = dict(OUTPUT_DEFAULTS)
+    for source in ((config or {}).get('output') or {}, overrides or {}):
+        for key, value in source.items():
+            if key not in OUTPUT_DEFAULTS or value is None or value == '':
+                continue
+            default = OUTPUT_DEFAULTS[key]
+            if isinstance(default, bool):
+                value = value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes', 'on')
+            elif isinstance(default, int):
+                value = int(value)
+            else:
+                value = str(value).lower()
+            options[key] = value
+
+    if options['format'] == 'jpg':
+        options['format'] = 'jpeg'
+    if options['format'] not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported format: {options['format']}")
+    options['compress_level'] = min(max(options['compress_level'], 0), 9)
+    options['colors'] = min(max(options['colors'], 0), 256)
+    options['quality'] = min(max(options['quality'], 1), 100)
+    options['method'] = min(max(options['method'], 0), 6)
+    return options
+
+
+def encode_image(image, options=None):
+    """Encode a rendered image according to resolved output options
+
+    Returns (encoded bytes, stats) where stats reports the format, the
+    encoded size in bytes and the encode time in milliseconds.
+    """
+    options = options or resolve_output_options(None)
+    image_format = options['format']
+    start = time.perf_counter()
+
+    with metrics.span('encode'):
+        if image_format == 'png':
+            if options['colors'] >= 2:
+                # Adaptive palette: much smaller files for flat designs
+                image = image.quantize(colors=options['colors'], method=Image.Quantize.FASTOCTREE,
+                                       dither=Image.Dither.NONE)
+            save_options = {'compress_level': options['compress_level'], 'optimize': options['optimize']}
+        elif image_format == 'webp':
+            save_options = {'lossless': options['lossless'], 'quality': options['quality'], 'method': options['method']}
+        else:
+            save_options = {'quality': options['quality'], 'optimize': options['optimize']}
+
+        buffered = io.BytesIO()
+        image.save(buffered, format=IMAGE_FORMATS[image_format]['pillow_format'], **save_options)
+        data = buffered.getvalue()
+
+    stats = {
+        'format': image_format,
+        'bytes': len(data),
+        'encode_ms': round((time.perf_counter() - start) * 1000, 2),
+    }
+    return data, stats
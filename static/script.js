@@ -1,5 +1,7 @@
 // Global state
 let currentConfig = null;
+// Config as last loaded from / saved to the server, used to send only the changes
+let savedConfig = null;
 let availableFonts = ['default'];
 let presetThemes = {};
 let autoPreviewEnabled = true;
@@ -7,6 +9,10 @@ let previewTimeout = null;
 
 // Note: Partial rendering cache removed - using instant HTML rendering now
 let lastRenderedConfig = null;
+// Blob URL of the last server-rendered image (revoked when replaced)
+let generatedImageUrl = null;
+// Sequence number of the latest preview request, so stale responses are dropped
+let previewSequence = 0;
 
 // Color conversion utilities
 function hexToRgb(hex) {
@@ -113,6 +119,7 @@ async function loadConfig() {
 
         if (data.success) {
             currentConfig = data.config;
+            savedConfig = JSON.parse(JSON.stringify(data.config));
             populateForm(currentConfig);
             // Auto generate HTML preview on load (instant)
             setTimeout(() => {
@@ -146,6 +153,7 @@ function populateForm(config) {
         document.getElementById('cardHeight').value = config.layout.card_height || 80;
         document.getElementById('padding').value = config.layout.padding || 20;
         document.getElementById('spacing').value = config.layout.spacing || 15;
+        document.getElementById('renderScale').value = config.layout.scale || 1;
     }
 
     // Theme
@@ -414,7 +422,8 @@ function collectConfig() {
             card_width: parseInt(document.getElementById('cardWidth').value),
             card_height: parseInt(document.getElementById('cardHeight').value),
             padding: parseInt(document.getElementById('padding').value),
-            spacing: parseInt(document.getElementById('spacing').value)
+            spacing: parseInt(document.getElementById('spacing').value),
+            scale: parseFloat(document.getElementById('renderScale').value)
         },
         theme: {
             name: currentConfig?.theme?.name || 'custom',
@@ -448,7 +457,9 @@ function collectConfig() {
             card_title_size: parseInt(document.getElementById('cardTitleSize').value),
             card_desc_size: parseInt(document.getElementById('cardDescSize').value)
         },
-        sections: collectSections()
+        sections: collectSections(),
+        // Encoder settings are not editable in the form; keep them across saves
+        output: currentConfig?.output
     };
 
     return config;
@@ -484,21 +495,103 @@ function collectSections() {
 }
 
 // Save configuration
+// JSON Patch operations turning the saved config into config: changed top-level
+// keys are replaced, sections are replaced, appended or removed one by one.
+// Section operations go by index, so each is preceded by a 'test' of the saved
+// section (and of the last one when the count changes): if the sections were
+// changed elsewhere since they were loaded, the server rejects the whole patch
+function configPatch(saved, config) {
+    const same = (a, b) => JSON.stringify(a) === JSON.stringify(b);
+    const patch = [];
+    const patchSections = Array.isArray(saved.sections) && Array.isArray(config.sections);
+    for (const key of Object.keys(config)) {
+        if (key === 'sections' && patchSections) continue;
+        if (!same(saved[key], config[key])) {
+            patch.push({ op: 'add', path: `/${key}`, value: config[key] });
+        }
+    }
+    if (patchSections) {
+        const before = saved.sections;
+        const after = config.sections;
+        const tested = new Set();
+        const test = (i) => {
+            if (!tested.has(i)) {
+                tested.add(i);
+                patch.push({ op: 'test', path: `/sections/${i}`, value: before[i] });
+            }
+        };
+        for (let i = 0; i < Math.min(before.length, after.length); i++) {
+            if (!same(before[i], after[i])) {
+                test(i);
+                patch.push({ op: 'replace', path: `/sections/${i}`, value: after[i] });
+            }
+        }
+        if (before.length !== after.length && before.length > 0) {
+            test(before.length - 1);
+        }
+        for (let i = before.length; i < after.length; i++) {
+            patch.push({ op: 'add', path: '/sections/-', value: after[i] });
+        }
+        for (let i = before.length - 1; i >= after.length; i--) {
+            test(i);
+            patch.push({ op: 'remove', path: `/sections/${i}` });
+        }
+    }
+    return patch;
+}
+
+// Reload the last saved config from the server (after a rejected patch)
+async function reloadSavedConfig() {
+    try {
+        const response = await fetch('/api/config');
+        const data = await response.json();
+        savedConfig = data.success ? data.config : null;
+    } catch (error) {
+        savedConfig = null;
+    }
+}
+
+// Save configuration: only the changes since the last save are sent (PATCH);
+// if the patch is rejected (409 when the config changed elsewhere, or any other
+// client error), the saved config is reloaded and the whole config is sent (POST)
 async function saveConfig() {
     try {
         const config = collectConfig();
-        const response = await fetch('/api/config', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(config)
-        });
+        let response = null;
+        if (savedConfig) {
+            const patch = configPatch(savedConfig, config);
+            if (patch.length === 0) {
+                currentConfig = config;
+                showToast('配置保存成功', 'success');
+                return;
+            }
+            response = await fetch('/api/config', {
+                method: 'PATCH',
+                headers: {
+                    'Content-Type': 'application/json-patch+json'
+                },
+                body: JSON.stringify(patch)
+            });
+            if (response.status >= 400 && response.status < 500) {
+                await reloadSavedConfig();
+                response = null;
+            }
+        }
+        if (!response) {
+            response = await fetch('/api/config', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(config)
+            });
+        }
 
         const data = await response.json();
 
         if (data.success) {
             currentConfig = config;
+            savedConfig = JSON.parse(JSON.stringify(config));
             showToast('配置保存成功', 'success');
         } else {
             showToast('保存配置失败', 'error');
@@ -524,14 +617,41 @@ function renderMarkdown(text) {
     return text;
 }
 
-// Preview with HTML/CSS rendering (real-time)
-function previewImage() {
+// Render the unsaved config on the server (no file is written)
+async function fetchRender(config, options = {}) {
+    const response = await fetch('/api/preview', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ config, ...options })
+    });
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!response.ok || !contentType.startsWith('image/')) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.error || '未知错误');
+    }
+    return response.blob();
+}
+
+// Preview with a fast low-resolution server render (real pixels);
+// falls back to the HTML/CSS preview if the server render fails
+async function previewImage() {
+    const sequence = ++previewSequence;
+    let config;
     try {
-        const config = collectConfig();
-        renderLivePreview(config);
+        config = collectConfig();
+        const blob = await fetchRender(config);
+        if (sequence !== previewSequence) return;
+        displayPreview(URL.createObjectURL(blob));
         lastRenderedConfig = JSON.parse(JSON.stringify(config));
     } catch (error) {
+        if (sequence !== previewSequence) return;
         console.error('Error rendering preview:', error);
+        try {
+            renderLivePreview(config || collectConfig());
+            lastRenderedConfig = JSON.parse(JSON.stringify(config || collectConfig()));
+        } catch (fallbackError) {
+            console.error('Error rendering HTML preview:', fallbackError);
+        }
     }
 }
 
@@ -742,21 +862,54 @@ function renderLivePreview(config) {
 }
 
 
+// Show loading spinner in the preview panel
+function showLoading() {
+    const previewContainer = document.querySelector('.preview-container');
+    previewContainer.innerHTML = `
+        <div id="previewLoading" class="loading">
+            <div class="spinner"></div>
+            <p>生成预览中...</p>
+        </div>`;
+}
+
+// Hide loading spinner
+function hideLoading() {
+    const loading = document.getElementById('previewLoading');
+    if (loading) loading.remove();
+}
+
+// Show a server-rendered image (blob URL or data URL) in the preview panel
+function displayPreview(src) {
+    const previewContainer = document.querySelector('.preview-container');
+    if (generatedImageUrl && generatedImageUrl !== src) {
+        URL.revokeObjectURL(generatedImageUrl);
+    }
+    generatedImageUrl = src.startsWith('blob:') ? src : null;
+    previewContainer.innerHTML = '';
+    const img = document.createElement('img');
+    img.id = 'previewImage';
+    img.alt = '预览图片';
+    img.src = src;
+    previewContainer.appendChild(img);
+}
+
 // Generate and save image
 async function generateImage() {
     try {
         showLoading();
 
-        const response = await fetch('/api/generate', {
+        // Binary mode: the server returns the PNG bytes directly
+        const response = await fetch('/api/generate?response=binary', {
             method: 'POST'
         });
 
-        const data = await response.json();
-
-        if (data.success) {
-            displayPreview(data.image);
+        const contentType = response.headers.get('Content-Type') || '';
+        if (response.ok && contentType.startsWith('image/')) {
+            const blob = await response.blob();
+            displayPreview(URL.createObjectURL(blob));
             showToast('图片生成成功！已保存到 output 目录', 'success');
         } else {
+            const data = await response.json();
             hideLoading();
             showToast('生成图片失败: ' + (data.error || '未知错误'), 'error');
         }
@@ -983,8 +1136,23 @@ function updateBackgroundOptions() {
 
 // Note: Loading functions removed - HTML preview is instant!
 
-// Download image - generate PNG from backend
+// Download image - full-size PNG rendered by the backend from the current editor state
 async function downloadImage() {
+    showToast('正在生成图片...', 'success');
+    try {
+        const blob = await fetchRender(collectConfig(), { scale: 1, output: { format: 'png' } });
+        const url = URL.createObjectURL(blob);
+        const link = document.createElement('a');
+        link.download = `help_menu_${Date.now()}.png`;
+        link.href = url;
+        link.click();
+        URL.revokeObjectURL(url);
+        showToast('图片已下载', 'success');
+        return;
+    } catch (error) {
+        console.error('Error rendering image on the server, capturing the HTML preview instead:', error);
+    }
+
     try {
         // Check if html2canvas is loaded
         if (typeof html2canvas === 'undefined') {
@@ -992,8 +1160,6 @@ async function downloadImage() {
             return;
         }
 
-        showToast('正在生成图片...', 'success');
-
         // Get the preview element
         const previewElement = document.querySelector('.help-menu-preview');
 
@@ -0,0 +1,145 @@
+import copy
+import json
+import os
+import threading
+
+import pytest
+import yaml
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    # app creates its upload/font/output folders in the working directory on import
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
+
+
+def test_render_cache_concurrent_puts_count_each_key_once(app_module, tmp_path):
+    cache = app_module.RenderCache(0, 10 ** 9, str(tmp_path))
+    data = os.urandom(1024 * 1024)
+    barrier = threading.Barrier(8)
+
+    def put():
+        for i in range(10):
+            barrier.wait()
+            cache.put(f'key{i % 5}', data)
+
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(os.listdir(tmp_path)) == [f'key{i}.bin' for i in range(5)]
+    assert cache.disk_bytes == 5 * len(data)
+    assert cache.get('key3')['data'] == data
+
+
+PATCH_CONFIG = {
+    'bot_info': {'name': 'Helper Bot', 'description': 'Answers questions'},
+    'theme': {'background_type': 'gradient', 'angle': 135},
+    'sections': [
+        {'name': 'Basics', 'items': [{'name': 'help', 'description': 'Show help'}]},
+        {'name': 'Admin', 'items': [{'name': 'ban', 'description': 'Ban a user'}]},
+    ],
+}
+
+
+@pytest.fixture
+def patch_client(app_module, tmp_path, monkeypatch):
+    """Test client whose default config store is a fresh copy of PATCH_CONFIG"""
+    monkeypatch.chdir(tmp_path)
+    store = app_module.ConfigStore(str(tmp_path / 'config.yaml'), str(tmp_path / 'config_history'), 5)
+    assert store.save(PATCH_CONFIG)
+    monkeypatch.setattr(app_module, 'config_store', store)
+    monkeypatch.setattr(app_module, 'render_cache', None)
+    return app_module.app.test_client(), tmp_path / 'config.yaml'
+
+
+def send_patch(client, patch, mimetype='application/json-patch+json'):
+    return client.patch('/api/config', data=json.dumps(patch), content_type=mimetype)
+
+
+def test_json_patch_add_appends_at_dash_and_at_length(app_module):
+    document = {'items': [1, 2]}
+    app_module.apply_json_patch(document, [{'op': 'add', 'path': '/items/-', 'value': 3},
+                                           {'op': 'add', 'path': '/items/3', 'value': 4}])
+    assert document == {'items': [1, 2, 3, 4]}
+    with pytest.raises(ValueError):
+        app_module.apply_json_patch(document, [{'op': 'add', 'path': '/items/5', 'value': 5}])
+
+
+def test_json_patch_move_into_own_child_is_rejected(app_module):
+    document = {'a': {'b': {}}}
+    with pytest.raises(ValueError):
+        app_module.apply_json_patch(document, [{'op': 'move', 'from': '/a', 'path': '/a/b/c'}])
+
+
+def test_config_changes_ignores_reordered_sections(app_module):
+    before = copy.deepcopy(PATCH_CONFIG)
+    after = copy.deepcopy(PATCH_CONFIG)
+    after['sections'].reverse()
+    assert app_module.config_changes(before, after) == {'keys': ['sections'], 'sections': [],
+                                                       'dropped_sections': 0}
+
+    after['sections'][0] = {'name': 'New', 'items': []}
+    assert app_module.config_changes(before, after) == {'keys': ['sections'], 'sections': [0],
+                                                       'dropped_sections': 1}
+
+
+def test_patch_applies_and_reports_changed_sections(patch_client):
+    client, path = patch_client
+    response = send_patch(client, [{'op': 'replace', 'path': '/sections/1/name', 'value': 'Moderation'},
+                                   {'op': 'add', 'path': '/sections/-', 'value': {'name': 'Fun', 'items': []}}])
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['success'] and data['changed']['sections'] == [1, 2]
+    saved = yaml.safe_load(path.read_text(encoding='utf-8'))
+    assert [section['name'] for section in saved['sections']] == ['Basics', 'Moderation', 'Fun']
+
+
+@pytest.mark.parametrize('operation', [
+    {'op': 'replace', 'path': '/sections/5', 'value': {}},
+    {'op': 'replace', 'path': '/missing', 'value': 1},
+    {'op': 'remove', 'path': '/sections/2'},
+    {'op': 'remove', 'path': '/bot_info/missing'},
+])
+def test_patch_on_missing_path_is_400(patch_client, operation):
+    client, path = patch_client
+    before = path.read_bytes()
+    response = send_patch(client, [operation])
+    assert response.status_code == 400
+    assert path.read_bytes() == before
+
+
+def test_failed_test_operation_is_409_and_leaves_the_file_unchanged(patch_client):
+    client, path = patch_client
+    before = path.read_bytes()
+    response = send_patch(client, [{'op': 'replace', 'path': '/bot_info/name', 'value': 'Renamed'},
+                                   {'op': 'test', 'path': '/sections/0/name', 'value': 'Other'}])
+    assert response.status_code == 409
+    assert path.read_bytes() == before
+
+
+def test_merge_patch_null_deletes_a_key(patch_client):
+    client, path = patch_client
+    response = send_patch(client, {'bot_info': {'description': None, 'qq': '123'}}, 'application/merge-patch+json')
+    assert response.status_code == 200
+    saved = yaml.safe_load(path.read_text(encoding='utf-8'))
+    assert saved['bot_info'] == {'name': 'Helper Bot', 'qq': '123'}
+    assert saved['sections'] == PATCH_CONFIG['sections']
+
+
+def test_patch_format_follows_the_content_type(patch_client):
+    client, path = patch_client
+    before = path.read_bytes()
+    # A list sent as a merge patch replaces the whole config, which is not a valid config
+    operations = [{'op': 'replace', 'path': '/bot_info/name', 'value': 'Renamed'}]
+    assert send_patch(client, operations, 'application/merge-patch+json').status_code == 400
+    assert send_patch(client, operations, 'text/plain').status_code == 415
+    assert path.read_bytes() == before
@@ -0,0 +1,146 @@
+import math
+
+import pytest
+from PIL import Image, ImageChops
+
+import renderer
+
+
+def reference_gradient(width, height, colors, angle):
+    """Per-pixel two-color gradient: the original axis-aligned ramps, CSS for other angles"""
+    if len(colors) < 2:
+        colors = colors + colors
+    color1 = renderer.hex_to_rgb(colors[0])
+    color2 = renderer.hex_to_rgb(colors[1])
+    angle = angle % 360
+    dir_x, dir_y = math.sin(math.radians(angle)), -math.cos(math.radians(angle))
+    span = abs(width * dir_x) + abs(height * dir_y)
+
+    img = Image.new('RGB', (width, height))
+    pixels = img.load()
+    for y in range(height):
+        for x in range(width):
+            if angle in [0, 180]:
+                ratio = x / width
+                if angle == 180:
+                    ratio = 1 - ratio
+            elif angle in [90, 270]:
+                ratio = y / height
+                if angle == 270:
+                    ratio = 1 - ratio
+            else:
+                ratio = 0.5 + ((x + 0.5 - width / 2) * dir_x + (y + 0.5 - height / 2) * dir_y) / span
+            ratio = min(max(ratio, 0.0), 1.0)
+            pixels[x, y] = tuple(int(color1[i] + (color2[i] - color1[i]) * ratio)
+                                 for i in range(3))
+    return img
+
+
+def original_diagonal_gradient(width, height, colors):
+    """The original renderer's diagonal: ratio = (x + y) / (width + height)"""
+    color1, color2 = renderer.hex_to_rgb(colors[0]), renderer.hex_to_rgb(colors[1])
+    img = Image.new('RGB', (width, height))
+    pixels = img.load()
+    for y in range(height):
+        for x in range(width):
+            ratio = (x + y) / (width + height)
+            pixels[x, y] = tuple(int(color1[i] + (color2[i] - color1[i]) * ratio)
+                                 for i in range(3))
+    return img
+
+
+def max_difference(img1, img2):
+    diff = ImageChops.difference(img1, img2)
+    return max(high for _, high in diff.getextrema())
+
+
+@pytest.mark.parametrize('name', sorted(renderer.PRESET_THEMES))
+def test_preset_gradients_match_reference(name):
+    theme = renderer.PRESET_THEMES[name]
+    colors = theme['background_gradient'][:2]
+    angle = theme.get('angle', 135)
+
+    expected = reference_gradient(300, 200, colors, angle)
+    actual = renderer.create_gradient_background(300, 200, colors, angle)
+    assert max_difference(expected, actual) <= 1
+
+
+def test_default_angle_matches_original_diagonal():
+    colors = renderer.PRESET_THEMES['default']['background_gradient']
+    expected = original_diagonal_gradient(300, 200, colors)
+    actual = renderer.create_gradient_background(300, 200, colors, 135)
+    assert max_difference(expected, actual) <= 1
+
+
+# Angle -> (start corner, end corner), as in CSS linear-gradient(<angle>deg)
+CORNERS = {'top-left': (0, 0), 'top-right': (119, 0), 'bottom-left': (0, 79), 'bottom-right': (119, 79)}
+
+
+@pytest.mark.parametrize('angle, start, end', [
+    (45, 'bottom-left', 'top-right'),
+    (135, 'top-left', 'bottom-right'),
+    (225, 'top-right', 'bottom-left'),
+    (315, 'bottom-right', 'top-left'),
+])
+def test_diagonal_gradients_follow_css_direction(angle, start, end):
+    img = renderer.create_gradient_background(120, 80, ['#000000', '#ffffff'], angle)
+    assert img.getpixel(CORNERS[start]) < (8, 8, 8)
+    assert img.getpixel(CORNERS[end]) > (247, 247, 247)
+
+
+def test_distinct_angles_produce_distinct_images():
+    angles = [30, 45, 60, 120, 135, 150, 210, 225, 300, 315]
+    images = [renderer.create_gradient_background(120, 80, ['#000000', '#ffffff'], angle).tobytes()
+              for angle in angles]
+    assert len(set(images)) == len(angles)
+
+
+def paginated_config(scale):
+    items = [{'name': f'/cmd{i}', 'description': f'Run command number {i}'} for i in range(12)]
+    return {
+        'bot_info': {'name': 'Helper Bot', 'description': 'Answers questions'},
+        'layout': {'scale': scale},
+        'sections': [{'name': f'Section {i}', 'items': items} for i in range(8)],
+    }
+
+
+@pytest.mark.parametrize('scale', [1, 1.5, 2])
+def test_paginate_config_page_height_is_in_pixels(scale):
+    config = paginated_config(scale)
+    pages = renderer.paginate_config(config, 1500)
+    assert len(pages) > 1
+    for page in pages:
+        layout = renderer.scale_layout(renderer.compute_layout(page), scale)
+        assert layout['height'] <= 1500
+        assert renderer.generate_help_image(page).height == layout['height']
+
+    # Every item ends up on exactly one page, under its section's name
+    names = [(section['name'], item['name']) for page in pages
+             for section in page['sections'] for item in section['items']]
+    assert names == [(section['name'], item['name']) for section in config['sections']
+                     for item in section['items']]
+
+
+def test_paginate_config_scale_overrides_layout_scale():
+    config = paginated_config(1)
+    assert (renderer.paginate_config(config, 1500, scale=2)
+            == renderer.paginate_config(paginated_config(1), 750))
+
+
+def header_config(padding, card_width):
+    return {
+        'bot_info': {'name': 'Helper Bot', 'qq': '123456', 'description': 'A long description of the bot ' * 4},
+        'layout': {'padding': padding, 'card_width': card_width, 'items_per_row': 3},
+        'sections': [{'name': 'Basics', 'items': [{'name': 'help', 'description': 'Show help'}]}],
+    }
+
+
+def test_cached_layers_match_a_cold_render():
+    # Same canvas width, different padding: no layer may be reused with stale pixels
+    renderer.clear_render_caches()
+    renderer.generate_help_image(header_config(20, 200))
+    warm = renderer.generate_help_image(header_config(23, 198))
+    renderer.clear_render_caches()
+    cold = renderer.generate_help_image(header_config(23, 198))
+    assert warm.size == cold.size
+    assert ImageChops.difference(warm.convert('RGB'), cold.convert('RGB')).getbbox() is None
@@ -0,0 +1,87 @@
+import pytest
+from PIL import ImageFont
+
+import renderer
+from renderer import ELLIPSIS
+
+
+@pytest.fixture(scope='module')
+def font():
+    return ImageFont.load_default(size=16)
+
+
+def line_text(line):
+    return ''.join(segment for _, segment, _ in line)
+
+
+def line_width(font, line):
+    return renderer.measure_text(font, line_text(line))
+
+
+def test_truncate_line_fits_with_one_ellipsis(font):
+    runs = [('abcdefghijklmnopqrstuvwxyz', False)]
+    result = renderer.truncate_line(runs, font, 80)
+    text = ''.join(char for char, _ in result)
+    assert text.endswith(ELLIPSIS) and text.count(ELLIPSIS) == 1
+    assert 'abcdefghijklmnopqrstuvwxyz'.startswith(text[:-1])
+    assert renderer.measure_text(font, text) <= 80
+
+
+def test_truncate_line_keeps_style_of_last_character(font):
+    runs = [('ab', False), ('cdefghijklmnop', True)]
+    result = renderer.truncate_line(runs, font, 60)
+    assert result[-1] == (ELLIPSIS, True)
+
+
+def test_truncate_line_too_narrow_leaves_only_ellipsis(font):
+    assert renderer.truncate_line([('abc', True)], font, 1) == [(ELLIPSIS, True)]
+    assert renderer.truncate_line([], font, 1) == [(ELLIPSIS, False)]
+
+
+def test_layout_text_breaks_on_newlines(font):
+    lines = renderer.layout_text('ab\ncd\nef', font)
+    assert [line_text(line) for line in lines] == ['ab', 'cd', 'ef']
+
+
+def test_layout_text_wraps_to_max_width(font):
+    text = 'the quick brown fox jumps over the lazy dog'
+    lines = renderer.layout_text(text, font, 100)
+    assert len(lines) > 1
+    assert all(line_width(font, line) <= 100 for line in lines)
+    assert ' '.join(line_text(line).strip() for line in lines) == text
+
+
+def test_layout_text_breaks_long_words_by_character(font):
+    lines = renderer.layout_text('a' * 50, font, 60)
+    assert len(lines) > 1
+    assert ''.join(line_text(line) for line in lines) == 'a' * 50
+    assert all(line_width(font, line) <= 60 for line in lines)
+
+
+@pytest.mark.parametrize('max_width', [None, 200])
+def test_layout_text_max_lines_appends_one_ellipsis(font, max_width):
+    lines = renderer.layout_text('ab\ncd\nef', font, max_width, 2)
+    assert [line_text(line) for line in lines] == ['ab', 'cd ' + ELLIPSIS]
+
+
+def test_layout_text_max_lines_truncates_full_last_line(font):
+    text = 'the quick brown fox jumps over the lazy dog'
+    lines = renderer.layout_text(text, font, 100, 2)
+    assert len(lines) == 2
+    last = line_text(lines[-1])
+    assert last.endswith(ELLIPSIS) and last.count(ELLIPSIS) == 1
+    assert line_width(font, lines[-1]) <= 100
+
+
+def test_layout_text_merges_and_positions_bold_runs(font):
+    lines = renderer.layout_text('plain **bold text** end', font)
+    assert len(lines) == 1
+    segments = [(segment, bold) for _, segment, bold in lines[0]]
+    assert segments == [('plain ', False), ('bold text', True), (' end', False)]
+    offsets = [x for x, _, _ in lines[0]]
+    assert offsets[0] == 0 and offsets == sorted(offsets)
+
+
+def test_layout_text_without_markdown_keeps_markers(font):
+    lines = renderer.layout_text('**not bold**', font, markdown=False)
+    assert [(segment, bold) for _, segment, bold in lines[0]] == [('**not bold**', False)]